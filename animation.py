@@ -1,9 +1,127 @@
-from PyQt5.QtWidgets import QOpenGLWidget
+from PyQt5.QtWidgets import QOpenGLWidget, QLabel
 from PyQt5.QtGui import QVector3D, QMatrix4x4, QQuaternion
 from PyQt5.QtCore import Qt, QPoint
 from OpenGL.GL import *
 from OpenGL.GLU import *
+import logging
+import time
 import numpy as np
+from lod import TrajectoryLOD, BLOCK_SIZE
+from profiling import FrameProfiler
+from trajectory import OUTCOME_STAYS, OUTCOME_DETACHES
+
+logger = logging.getLogger(__name__)
+
+LOD_MIN_POINTS = 2 * BLOCK_SIZE # Shorter trajectories are always drawn at full resolution
+LOD_BASE_TOLERANCE = 2.5e-4 # Finest simplification tolerance, in sphere radii
+FULL_UPLOAD_LIMIT = 1 << 21 # Longer (e.g. memory-mapped) trajectories are drawn from the pyramid only
+FIELD_OF_VIEW = 45.0 # Vertical field of view, degrees
+RIDER_POINT_SIZE = 9.0 # Pixels
+RIDER_COLORS = np.array([[0.35, 0.1, 0.6, 1.0],  # Clear
+                         [1.0, 0.55, 0.0, 1.0],  # Within the proximity distance of another rider
+                         [0.85, 0.0, 0.0, 1.0]], # Collision
+                        dtype=np.float32)
+PROFILE_OVERLAY_INTERVAL = 0.5 # Seconds between updates of the profiling overlay
+OVERLAY_COLORS = np.array([[0.1, 0.6, 0.2, 0.5],   # OUTCOME_STAYS
+                           [0.85, 0.1, 0.1, 0.5],  # OUTCOME_DETACHES
+                           [0.95, 0.55, 0.0, 0.5],  # OUTCOME_FALLS
+                           [0.5, 0.5, 0.5, 0.5]],   # OUTCOME_INVALID
+                          dtype=np.float32)
+
+def sphere_wireframe(num_meridians=32, num_parallels=32, num_equator_points=64):
+    """
+    Vertices of the unit-sphere wireframe (Animation coords, Y-up).
+
+    Returns:
+        tuple: (vertices, (meridians, parallels, equator))
+               vertices is a float32 (n, 3) array; meridians and parallels
+               are (firsts, counts) int32 arrays for glMultiDrawArrays,
+               equator is a single (first, count) pair.
+    """
+    def ring_points(theta, phi):
+        return np.stack([np.sin(theta) * np.cos(phi),
+                         np.cos(theta) * np.ones_like(phi),
+                         np.sin(theta) * np.sin(phi)], axis=-1)
+
+    # Meridians: line strips from pole to pole
+    phi = np.arange(num_meridians) * 2 * np.pi / num_meridians
+    theta = np.arange(num_parallels + 1) * np.pi / num_parallels
+    meridians = ring_points(theta[None, :], phi[:, None]).reshape(-1, 3)
+    # Parallels: closed loops, poles excluded
+    theta = np.arange(1, num_parallels)[:, None] * np.pi / num_parallels
+    parallels = ring_points(theta, phi[None, :]).reshape(-1, 3)
+    equator = ring_points(np.pi / 2, np.arange(num_equator_points) * 2 * np.pi / num_equator_points)
+
+    vertices = np.concatenate([meridians, parallels, equator]).astype(np.float32)
+    meridian_draws = (np.arange(num_meridians, dtype=np.int32) * (num_parallels + 1),
+                      np.full(num_meridians, num_parallels + 1, dtype=np.int32))
+    parallel_draws = (len(meridians) + np.arange(num_parallels - 1, dtype=np.int32) * num_meridians,
+                      np.full(num_parallels - 1, num_meridians, dtype=np.int32))
+    equator_draw = (len(meridians) + len(parallels), num_equator_points)
+    return vertices, (meridian_draws, parallel_draws, equator_draw)
+
+
+def detachment_outcomes(contacts):
+    """
+    OUTCOME_DETACHES for trajectories that leave the wall at some point,
+    OUTCOME_STAYS for the others.
+
+    Args:
+        contacts: Sequence of (n_i,) contact flags, or an (n, N) array with
+                  one column per trajectory.
+    """
+    if isinstance(contacts, np.ndarray) and contacts.ndim == 2:
+        detaches = np.any(contacts[:-1] & ~contacts[1:], axis=0)
+    else:
+        detaches = np.array([np.any(contact[:-1] & ~contact[1:]) for contact in contacts], dtype=bool)
+    return np.where(detaches, OUTCOME_DETACHES, OUTCOME_STAYS)
+
+
+def pack_trajectories(trajectories, outcomes, max_vertices=None):
+    """
+    Packs trajectories into one vertex array drawn with glMultiDrawArrays.
+
+    The trajectories are grouped by outcome, so every colour is a single
+    multi-draw over a contiguous range of the (firsts, counts) arrays.
+
+    Args:
+        trajectories: Sequence of (n_i, 3) position arrays, or an (n, N, 3)
+                      sample-major array (calculate_ensemble, RidersResult).
+        outcomes: (N,) codes indexing OVERLAY_COLORS.
+        max_vertices (int): Optional cap per trajectory; longer ones are
+                            resampled evenly, keeping both ends.
+
+    Returns:
+        tuple: (vertices, draws); vertices is a float32 (m, 3) array, draws
+               a list of (outcome, firsts, counts) with int32 arrays.
+    """
+    outcomes = np.asarray(outcomes, dtype=np.intp)
+    order = np.argsort(outcomes, kind='stable')
+
+    def kept(n):
+        if max_vertices is None or n <= max_vertices:
+            return slice(None)
+        return np.linspace(0, n - 1, max_vertices).astype(np.intp)
+
+    if isinstance(trajectories, np.ndarray) and trajectories.ndim == 3:
+        # Equal lengths: all trajectories resampled and reordered in one go
+        samples = trajectories[kept(len(trajectories))]
+        vertices = np.ascontiguousarray(samples[:, order].swapaxes(0, 1), dtype=np.float32).reshape(-1, 3)
+        counts = np.full(len(order), len(samples), dtype=np.int32)
+    else:
+        parts = [np.asarray(trajectories[k]).reshape(-1, 3) for k in order]
+        parts = [part[kept(len(part))] for part in parts]
+        vertices = np.concatenate(parts).astype(np.float32) if parts else np.empty((0, 3), dtype=np.float32)
+        counts = np.array([len(part) for part in parts], dtype=np.int32)
+    firsts = (np.cumsum(counts) - counts).astype(np.int32)
+
+    sorted_outcomes = outcomes[order]
+    draws = []
+    for outcome in np.unique(sorted_outcomes):
+        start, stop = np.searchsorted(sorted_outcomes, [outcome, outcome + 1])
+        draws.append((int(outcome), firsts[start:stop].copy(), counts[start:stop].copy()))
+    return vertices, draws
+
 
 class SphereWidget(QOpenGLWidget):
     def __init__(self, parent=None):
@@ -11,30 +129,154 @@ class SphereWidget(QOpenGLWidget):
         self.rotation = QQuaternion()
         self.last_pos = QVector3D()
         self.rotation_speed = 1.0
-        self.trajectory = []
+        self.trajectory = np.empty((0, 3))
         self.current_frame = 0
+        self.current_position = None # Interpolated marker position between samples
         self.sphere_radius = 1.0
         self.zoom = 1.0
+        self.sphere_vbo = None
+        self.trajectory_vbo = None
+        self.trajectory_dirty = True
+        self.trajectory_lod = None
+        self.trajectory_regions = None # [first vertex, capacity, uploaded] of each level in trajectory_vbo
+        self.lod_draws = [(0, None)]
+        self.overlay_vbo = None
+        self.overlay_vertices = np.empty((0, 3), dtype=np.float32)
+        self.overlay_draws = []
+        self.overlay_dirty = False
+        self.viewport_height = 0
+        self.marker_quadric = None
+        self.rider_positions = np.empty((0, 3), dtype=np.float32)
+        self.rider_colors = np.empty((0, 4), dtype=np.float32)
+        self.profiler = None # profiling.FrameProfiler while profiling is on
+        self.profile_overlay = None
+        self.overlay_profilers = []
+        self.overlay_updated = 0.0
 
     def set_force_direction(self, force_vec):
         self.force_direction = force_vec
 
     def set_sphere_radius(self, radius):
+        if radius != self.sphere_radius:
+            self.trajectory_lod = None # Simplification tolerances scale with the radius
+            self.trajectory_regions = None
+            self.trajectory_dirty = True
         self.sphere_radius = radius
         self.update()
 
-    def set_trajectory(self, trajectory):
-        self.trajectory = trajectory
+    def set_trajectory(self, trajectory, extend=False):
+        """
+        Args:
+            trajectory: (n, 3) array; floating-point positions (including
+                        memory-mapped ones) are kept by reference, not copied.
+            extend (bool): The new positions continue the current trajectory
+                           (its samples are unchanged), so only the new part
+                           of the level-of-detail pyramid is rebuilt and
+                           uploaded.
+        """
+        trajectory = np.asarray(trajectory)
+        if trajectory.dtype.kind != 'f':
+            trajectory = trajectory.astype(float)
+        self.trajectory = trajectory.reshape(-1, 3)
+        if not extend:
+            self.trajectory_lod = None
+            self.trajectory_regions = None
+        self.trajectory_dirty = True
         self.current_frame = 0
+        self.current_position = None
+        self.update()
+
+    def set_overlay(self, trajectories, outcomes=None, contacts=None, max_vertices=None):
+        """
+        Trajectories drawn behind the current one for comparison, e.g. the
+        riders of an ensemble or the points of a sweep, coloured by outcome
+        (OVERLAY_COLORS). They are packed into one vertex buffer once and
+        drawn with one glMultiDrawArrays per colour.
+
+        Args:
+            trajectories: Sequence of (n_i, 3) position arrays or an (n, N, 3)
+                          sample-major array; an empty sequence removes the overlay.
+            outcomes: Optional (N,) trajectory.OUTCOME_* codes.
+            contacts: Contact flags (as for detachment_outcomes) to derive the
+                      outcomes from when none are given; otherwise all stay.
+            max_vertices (int): Optional cap on the vertices per trajectory.
+        """
+        n_trajectories = trajectories.shape[1] if isinstance(trajectories, np.ndarray) and trajectories.ndim == 3 \
+            else len(trajectories)
+        if outcomes is None:
+            outcomes = (detachment_outcomes(contacts) if contacts is not None
+                        else np.full(n_trajectories, OUTCOME_STAYS))
+        self.overlay_vertices, self.overlay_draws = pack_trajectories(trajectories, outcomes, max_vertices)
+        self.overlay_dirty = True
         self.update()
 
-    def set_current_frame(self, frame):
-        if self.trajectory:
+    def set_riders(self, positions, states=None):
+        """
+        Positions of the riders of a multi-rider run, drawn as points.
+
+        Args:
+            positions: (N, 3) current rider positions; an empty array hides them.
+            states: Optional (N,) ints indexing RIDER_COLORS: 0 clear,
+                    1 close to another rider, 2 colliding.
+        """
+        self.rider_positions = np.ascontiguousarray(positions, dtype=np.float32).reshape(-1, 3)
+        states = np.zeros(len(self.rider_positions), dtype=np.intp) if states is None else np.asarray(states)
+        self.rider_colors = RIDER_COLORS[states]
+        self.update()
+
+    def set_current_frame(self, frame, position=None):
+        """
+        Args:
+            frame (int): Last trajectory sample to draw.
+            position: Optional marker position after that sample (playback
+                      between samples); defaults to the sample itself.
+        """
+        if len(self.trajectory):
             self.current_frame = max(0, min(frame, len(self.trajectory) - 1))
         else:
             self.current_frame = 0
+        self.current_position = None if position is None else np.asarray(position, dtype=float)
+        self.update()
+
+    def set_profiling(self, enabled, overlay=False, sync=False, extra=()):
+        """
+        Times the phases of every frame (setup, wireframe with the gravity
+        arrow, overlay, trajectory, markers, riders) in self.profiler.
+
+        Args:
+            enabled (bool): False stops profiling and removes the overlay.
+            overlay (bool): Show the statistics in the corner of the view.
+            sync (bool): Wait for the GPU after every phase (glFinish), so the
+                         phases include the drawing itself, not only issuing it.
+            extra: Further profilers shown in the overlay, e.g. the
+                   PhaseProfiler of the PhysicsModel.
+        """
+        self.profiler = FrameProfiler(sync=glFinish if sync else None) if enabled else None
+        self.overlay_profilers = [self.profiler, *extra] if enabled else []
+        if enabled and overlay:
+            if self.profile_overlay is None:
+                self.profile_overlay = QLabel(self)
+                self.profile_overlay.setStyleSheet("background-color: rgba(255, 255, 255, 200); "
+                                                   "font-family: monospace; font-size: 11px;")
+                self.profile_overlay.move(8, 8)
+            self.profile_overlay.show()
+        elif self.profile_overlay is not None:
+            self.profile_overlay.hide()
         self.update()
 
+    def update_profile_overlay(self):
+        now = time.perf_counter()
+        if now - self.overlay_updated < PROFILE_OVERLAY_INTERVAL:
+            return
+        self.overlay_updated = now
+        self.profile_overlay.setText("\n".join(profiler.format() for profiler in self.overlay_profilers))
+        self.profile_overlay.adjustSize()
+
+    def marker_position(self):
+        if self.current_position is not None:
+            return self.current_position
+        return self.trajectory[self.current_frame]
+
     def initializeGL(self):
         glEnable(GL_DEPTH_TEST)
         glClearColor(1.0, 1.0, 1.0, 1.0)
@@ -43,7 +285,37 @@ class SphereWidget(QOpenGLWidget):
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
+        # Static geometry is generated and uploaded once per GL context
+        vertices, self.sphere_draws = sphere_wireframe()
+        self.sphere_vbo, self.trajectory_vbo, self.overlay_vbo = glGenBuffers(3)
+        glBindBuffer(GL_ARRAY_BUFFER, self.sphere_vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.trajectory_regions = None
+        self.trajectory_dirty = True
+        self.overlay_dirty = True
+        self.marker_quadric = gluNewQuadric()
+        if self.context() is not None:
+            self.context().aboutToBeDestroyed.connect(self.cleanupGL)
+
+    def cleanupGL(self):
+        self.makeCurrent()
+        self.release_gl_resources()
+        self.doneCurrent()
+
+    def release_gl_resources(self):
+        # Expects the context that created the resources to be current
+        if self.sphere_vbo is not None:
+            glDeleteBuffers(3, [self.sphere_vbo, self.trajectory_vbo, self.overlay_vbo])
+            self.sphere_vbo = self.trajectory_vbo = self.overlay_vbo = None
+        if self.marker_quadric is not None:
+            gluDeleteQuadric(self.marker_quadric)
+            self.marker_quadric = None
+
     def paintGL(self):
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin_frame()
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
@@ -56,50 +328,54 @@ class SphereWidget(QOpenGLWidget):
         rot_matrix = QMatrix4x4()
         rot_matrix.rotate(self.rotation)
         glMultMatrixf(rot_matrix.data())
+        if profiler is not None: profiler.lap("setup")
+
+        self.draw_wireframe()
+        self.draw_gravity_arrow()
+        if profiler is not None: profiler.lap("wireframe")
+        if self.overlay_draws:
+            self.draw_overlay()
+            if profiler is not None: profiler.lap("overlay")
+        if len(self.trajectory):
+            self.draw_trajectory()
+            if profiler is not None: profiler.lap("trajectory")
+            self.draw_markers()
+            if profiler is not None: profiler.lap("markers")
+        if len(self.rider_positions):
+            self.draw_riders()
+            if profiler is not None: profiler.lap("riders")
+
+        glFlush()
+        if profiler is not None:
+            profiler.end_frame()
+            if self.profile_overlay is not None and not self.profile_overlay.isHidden():
+                self.update_profile_overlay()
 
+    def draw_wireframe(self):
+        # Unit-sphere geometry from the VBO, scaled to the current radius
+        glPushMatrix()
+        glScalef(self.sphere_radius, self.sphere_radius, self.sphere_radius)
         glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, self.sphere_vbo)
+        glVertexPointer(3, GL_FLOAT, 0, None)
+
         glColor4f(0.0, 0.6, 1.0, 1.0)
         glLineWidth(1.2)
-
-        num_meridians = 32
-        num_parallels = 32
-        for j in range(num_meridians):
-            phi = j * 2 * np.pi / num_meridians
-            glBegin(GL_LINE_STRIP)
-            for i in range(num_parallels + 1):
-                theta = i * np.pi / num_parallels
-                x = self.sphere_radius * np.sin(theta) * np.cos(phi)
-                z_phys = self.sphere_radius * np.cos(theta)
-                y_anim = z_phys
-                z_anim = self.sphere_radius * np.sin(theta) * np.sin(phi)
-                glVertex3f(x, y_anim, z_anim)
-            glEnd()
-
-        for i in range(1, num_parallels):
-            theta = i * np.pi / num_parallels
-            glBegin(GL_LINE_LOOP)
-            for j in range(num_meridians):
-                phi = j * 2 * np.pi / num_meridians
-                x = self.sphere_radius * np.sin(theta) * np.cos(phi)
-                y_anim = self.sphere_radius * np.cos(theta)
-                z_anim = self.sphere_radius * np.sin(theta) * np.sin(phi)
-                glVertex3f(x, y_anim, z_anim)
-            glEnd()
+        meridians, parallels, equator = self.sphere_draws
+        glMultiDrawArrays(GL_LINE_STRIP, meridians[0], meridians[1], len(meridians[0]))
+        glMultiDrawArrays(GL_LINE_LOOP, parallels[0], parallels[1], len(parallels[0]))
 
         glLineWidth(1.8)
         glColor4f(1.0, 0.2, 0.2, 1.0)
-        glBegin(GL_LINE_LOOP)
-        theta = np.pi / 2
-        num_equator_points = 64
-        for j in range(num_equator_points):
-            phi = j * 2 * np.pi / num_equator_points
-            x = self.sphere_radius * np.sin(theta) * np.cos(phi)
-            y_anim = self.sphere_radius * np.cos(theta)
-            z_anim = self.sphere_radius * np.sin(theta) * np.sin(phi)
-            glVertex3f(x, y_anim, z_anim)
-        glEnd()
+        glDrawArrays(GL_LINE_LOOP, equator[0], equator[1])
         glLineWidth(1.0)
 
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glPopMatrix()
+
+    def draw_gravity_arrow(self):
         arrow_length_gravity = self.sphere_radius * 0.3
         glColor4f(0.0, 0.8, 0.0, 1.0)
         start_y = self.sphere_radius
@@ -122,77 +398,187 @@ class SphereWidget(QOpenGLWidget):
         glEnd()
         glLineWidth(1.0)
 
-        if self.trajectory:
-            glColor4f(1.0, 0.0, 0.0, 1.0)
-            glLineWidth(5.0)
+    def draw_overlay(self):
+        if self.overlay_dirty:
+            glBindBuffer(GL_ARRAY_BUFFER, self.overlay_vbo)
+            glBufferData(GL_ARRAY_BUFFER, self.overlay_vertices.nbytes, self.overlay_vertices, GL_STATIC_DRAW)
+            self.overlay_dirty = False
+        glLineWidth(1.5)
+        glDepthMask(GL_FALSE) # Translucent lines: the current trajectory is never hidden behind them
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, self.overlay_vbo)
+        glVertexPointer(3, GL_FLOAT, 0, None)
+        for outcome, firsts, counts in self.overlay_draws:
+            glColor4f(*OVERLAY_COLORS[outcome])
+            glMultiDrawArrays(GL_LINE_STRIP, firsts, counts, len(firsts))
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDepthMask(GL_TRUE)
+        glLineWidth(1.0)
+
+    def draw_trajectory(self):
+        if self.trajectory_dirty:
+            self.upload_trajectory()
+        first, indices = self.lod_draws[self.lod_level()]
+        if indices is None:
+            count = self.current_frame + 1
+        else:
+            # Kept samples up to the current frame, then a segment to the exact position
+            count = int(np.searchsorted(indices, self.current_frame, side='right'))
+        glColor4f(1.0, 0.0, 0.0, 1.0)
+        glLineWidth(5.0)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, self.trajectory_vbo)
+        glVertexPointer(3, GL_FLOAT, 0, None)
+        glDrawArrays(GL_LINE_STRIP, first, count)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+        # Tail from the last drawn vertex to the current sample and the marker
+        tail = []
+        if indices is not None and indices[count - 1] < self.current_frame:
+            tail = [self.trajectory[indices[count - 1]], self.trajectory[self.current_frame]]
+        if self.current_position is not None:
+            tail = (tail or [self.trajectory[self.current_frame]]) + [self.current_position]
+        if tail:
             glBegin(GL_LINE_STRIP)
-            for point in self.trajectory[:self.current_frame+1]:
-                glVertex3f(*point)
+            for vertex in tail:
+                glVertex3f(*vertex)
             glEnd()
 
-            if self.current_frame < len(self.trajectory):
-                current_pos = self.trajectory[self.current_frame]
-                glPushMatrix()
-                glTranslatef(*current_pos)
-                quad = gluNewQuadric()
-                glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
-                glColor4f(0.9, 0.7, 0.0, 1.0)
-                gluSphere(quad, self.sphere_radius * 0.05, 16, 16)
-                gluDeleteQuadric(quad)
-                glPopMatrix()
-
-                if self.current_frame + 1 < len(self.trajectory):
-                    next_pos = self.trajectory[self.current_frame + 1]
-                    vel_dir = (next_pos[0] - current_pos[0],
-                               next_pos[1] - current_pos[1],
-                               next_pos[2] - current_pos[2])
-                    mag = np.linalg.norm(vel_dir)
-                    if mag > 1e-6:
-                        norm_vel_dir = (vel_dir[0] / mag, vel_dir[1] / mag, vel_dir[2] / mag)
-                        arrow_length_vel = self.sphere_radius * 0.2
-                        arrow_end = (current_pos[0] + norm_vel_dir[0] * arrow_length_vel,
-                                     current_pos[1] + norm_vel_dir[1] * arrow_length_vel,
-                                     current_pos[2] + norm_vel_dir[2] * arrow_length_vel)
-                        glColor4f(0.0, 0.6, 1.0, 1.0)
-                        glLineWidth(5.0)
-                        glBegin(GL_LINES)
-                        glVertex3f(*current_pos)
-                        glVertex3f(*arrow_end)
-                        glEnd()
-                        glLineWidth(1.0)
-                glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
-
-            if hasattr(self, 'force_direction') and self.force_direction is not None:
-                force_dir = np.array(self.force_direction)
-                force_mag = np.linalg.norm(force_dir)
-                if force_mag > 1e-6:
-                    force_dir /= force_mag
-                    glColor4f(1.0, 0.5, 0.0, 1.0)
-                    glLineWidth(2.0)
+    def lod_level(self):
+        """Coarsest pyramid level whose error stays below half a pixel at the current zoom."""
+        if len(self.lod_draws) == 1:
+            return 0
+        # Trajectory points are no closer to the camera than the near side of the sphere
+        camera_distance = self.sphere_radius * 3.5 * self.zoom * np.sqrt(3)
+        nearest = max(camera_distance - self.sphere_radius, 1e-6)
+        height = self.viewport_height or self.height() or 1
+        world_per_pixel = 2 * nearest * np.tan(np.radians(FIELD_OF_VIEW / 2)) / height
+        return self.trajectory_lod.select_level(world_per_pixel)
+
+    def upload_trajectory(self):
+        # Uploaded once per set_trajectory; scrubbing only changes the draw count.
+        # Long trajectories also upload every pyramid level behind the full one;
+        # beyond FULL_UPLOAD_LIMIT samples level 1 stands in for the full one.
+        # Every level has its own region of the buffer: when the trajectory was
+        # extended only the new vertices of each level are uploaded, and a level
+        # outgrowing its region reallocates the buffer with room to double.
+        n = len(self.trajectory)
+        levels = [None] # Sample indices of each uploaded level, None for all samples
+        lod_start = n
+        if n >= LOD_MIN_POINTS:
+            if self.trajectory_lod is None:
+                self.trajectory_lod = TrajectoryLOD(self.sphere_radius * LOD_BASE_TOLERANCE)
+            lod_start = self.trajectory_lod.update(self.trajectory)
+            if n > FULL_UPLOAD_LIMIT:
+                levels = []
+            levels += [self.trajectory_lod.indices(level) for level in range(1, self.trajectory_lod.n_levels)]
+        counts = [n if indices is None else len(indices) for indices in levels]
+        regions = self.trajectory_regions
+        glBindBuffer(GL_ARRAY_BUFFER, self.trajectory_vbo)
+        if (regions is None or len(regions) != len(levels)
+                or any(count > capacity for (_, capacity, _), count in zip(regions, counts))):
+            room = 1 if regions is None else 2 # Extended trajectories are likely to grow further
+            regions, first = [], 0
+            for count in counts:
+                regions.append([first, count * room, 0])
+                first += count * room
+            glBufferData(GL_ARRAY_BUFFER, first * 12, None, GL_DYNAMIC_DRAW)
+        for region, indices, count in zip(regions, levels, counts):
+            first, _, uploaded = region
+            if indices is None:
+                kept = min(uploaded, count)
+                vertices = self.trajectory[kept:count]
+            else:
+                kept = min(uploaded, int(np.searchsorted(indices, lod_start)))
+                vertices = self.trajectory[indices[kept:]]
+            vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+            if len(vertices):
+                glBufferSubData(GL_ARRAY_BUFFER, (first + kept) * 12, vertices.nbytes, vertices)
+            region[2] = count
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.trajectory_regions = regions
+        self.lod_draws = [(first, indices) for (first, _, _), indices in zip(regions, levels)]
+        if n > FULL_UPLOAD_LIMIT:
+            self.lod_draws.insert(0, self.lod_draws[0])
+        self.trajectory_dirty = False
+
+    def draw_markers(self):
+        if self.current_frame < len(self.trajectory):
+            current_pos = self.marker_position()
+            glPushMatrix()
+            glTranslatef(*current_pos)
+            glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+            glColor4f(0.9, 0.7, 0.0, 1.0)
+            gluSphere(self.marker_quadric, self.sphere_radius * 0.05, 16, 16)
+            glPopMatrix()
+
+            if self.current_frame + 1 < len(self.trajectory):
+                next_pos = self.trajectory[self.current_frame + 1]
+                vel_dir = (next_pos[0] - current_pos[0],
+                           next_pos[1] - current_pos[1],
+                           next_pos[2] - current_pos[2])
+                mag = np.linalg.norm(vel_dir)
+                if mag > 1e-6:
+                    norm_vel_dir = (vel_dir[0] / mag, vel_dir[1] / mag, vel_dir[2] / mag)
+                    arrow_length_vel = self.sphere_radius * 0.2
+                    arrow_end = (current_pos[0] + norm_vel_dir[0] * arrow_length_vel,
+                                 current_pos[1] + norm_vel_dir[1] * arrow_length_vel,
+                                 current_pos[2] + norm_vel_dir[2] * arrow_length_vel)
+                    glColor4f(0.0, 0.6, 1.0, 1.0)
+                    glLineWidth(5.0)
                     glBegin(GL_LINES)
                     glVertex3f(*current_pos)
-                    glVertex3f(current_pos[0] + force_dir[0] * 0.5,
-                               current_pos[1] + force_dir[1] * 0.5,
-                               current_pos[2] + force_dir[2] * 0.5)
+                    glVertex3f(*arrow_end)
                     glEnd()
+                    glLineWidth(1.0)
+            glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
 
-            if self.trajectory and self.current_frame < len(self.trajectory):
-                pos = self.trajectory[self.current_frame]
-                glColor3f(0.0, 0.8, 0.0)
+        if hasattr(self, 'force_direction') and self.force_direction is not None:
+            force_dir = np.array(self.force_direction)
+            force_mag = np.linalg.norm(force_dir)
+            if force_mag > 1e-6:
+                force_dir /= force_mag
+                glColor4f(1.0, 0.5, 0.0, 1.0)
+                glLineWidth(2.0)
                 glBegin(GL_LINES)
-                glVertex3f(*pos)
-                glVertex3f(pos[0], pos[1] - 0.5, pos[2])
+                glVertex3f(*current_pos)
+                glVertex3f(current_pos[0] + force_dir[0] * 0.5,
+                           current_pos[1] + force_dir[1] * 0.5,
+                           current_pos[2] + force_dir[2] * 0.5)
                 glEnd()
 
-        glFlush()
+        if self.current_frame < len(self.trajectory):
+            pos = self.marker_position()
+            glColor3f(0.0, 0.8, 0.0)
+            glBegin(GL_LINES)
+            glVertex3f(*pos)
+            glVertex3f(pos[0], pos[1] - 0.5, pos[2])
+            glEnd()
+
+    def draw_riders(self):
+        # Client-side arrays: a few hundred points that change every frame
+        glPointSize(RIDER_POINT_SIZE)
+        glEnable(GL_POINT_SMOOTH)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, self.rider_positions)
+        glColorPointer(4, GL_FLOAT, 0, self.rider_colors)
+        glDrawArrays(GL_POINTS, 0, len(self.rider_positions))
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisable(GL_POINT_SMOOTH)
+        glPointSize(1.0)
 
     def resizeGL(self, w, h):
+        self.viewport_height = h * self.devicePixelRatioF()
         glViewport(0, 0, w, h)
         glMatrixMode(GL_PROJECTION)
         glLoadIdentity()
         if h == 0: h = 1
         aspect_ratio = w / h
-        gluPerspective(45, aspect_ratio, 0.1, 100.0 * self.sphere_radius)
+        gluPerspective(FIELD_OF_VIEW, aspect_ratio, 0.1, 100.0 * self.sphere_radius)
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
@@ -219,5 +605,5 @@ class SphereWidget(QOpenGLWidget):
         zoom_factor = 0.9 if delta > 0 else 1.1
         self.zoom *= zoom_factor
         self.zoom = max(0.1, min(self.zoom, 5.0))
-        print(f"Zoom factor: {self.zoom:.2f}")
+        logger.debug("Zoom factor: %.2f", self.zoom)
         self.update()
@@ -0,0 +1,280 @@
+# --- START OF FILE batch.py ---
+
+"""
+Headless batch runner: simulates scenarios from a JSON or CSV file.
+
+    python -m batch scenarios.json --out-dir results/ --summary summary.csv
+    python -m batch scenarios.csv --format csv --workers 8
+
+(run from the project directory, or with it on PYTHONPATH).
+
+JSON input is a list of scenario objects, or {"defaults": {...},
+"scenarios": [...]} where defaults fill in missing keys. Scenario keys:
+
+    name                         output file stem (default: scenario_00000, ...)
+    radius, sim_time             required
+    initial_pos, initial_vel     required, [x, y, z] in Animation coords (Y-up)
+    mass                         default 100.0
+    drive_force                  default 0.0
+    integrator, backend          as for PhysicsModel.calculate_trajectory
+                                 (default "euler", "numpy")
+
+CSV input has one scenario per row with the same keys as columns, except
+that positions and velocities are split into x, y, z, vx, vy, vz.
+
+Each trajectory is written by the worker that computed it, as soon as it
+is done: TrajectoryResult .npz files, or CSV files (time, x, y, z, vx,
+vy, vz, contact) streamed chunk by chunk without holding the whole run
+in memory. One summary row per scenario is written (and flushed) as
+results arrive, to stdout unless --summary is given. Besides the run
+statistics it holds safety metrics from the derived channels (see
+trajectory.derived_channels): the largest g-load exerted by the wall and
+the smallest margin to the critical speed while on the wall ("" if the
+rider never touched it).
+
+Only NumPy and the model modules are imported; no Qt or OpenGL, so
+start-up stays short when the runner is launched by job schedulers.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from model import PhysicsModel
+
+SCENARIO_DEFAULTS = dict(mass=100.0, drive_force=0.0, integrator="euler", backend="numpy")
+SCENARIO_KEYS = {"name", "radius", "sim_time", "initial_pos", "initial_vel"} | set(SCENARIO_DEFAULTS)
+SUMMARY_FIELDS = ("name", "status", "samples", "end_time", "detach_time", "min_height", "events",
+                  "max_g_load", "min_critical_margin", "seconds", "output", "error")
+CSV_CHUNK_SIZE = 10000
+
+
+def load_scenarios(path):
+    """
+    Reads scenarios from a .json or .csv file.
+
+    Returns:
+        list: Scenario dicts with every key filled in.
+    """
+    if path.lower().endswith(".csv"):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        scenarios = []
+        for row in rows:
+            row = {key.strip(): value.strip() for key, value in row.items() if value is not None and value.strip()}
+            for key, columns in (("initial_pos", ("x", "y", "z")), ("initial_vel", ("vx", "vy", "vz"))):
+                if all(column in row for column in columns):
+                    row[key] = [float(row.pop(column)) for column in columns]
+            for key in ("radius", "sim_time", "mass", "drive_force"):
+                if key in row:
+                    row[key] = float(row[key])
+            scenarios.append(row)
+        defaults = {}
+    else:
+        with open(path) as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            defaults, scenarios = data.get("defaults", {}), data["scenarios"]
+        else:
+            defaults, scenarios = {}, data
+    return [complete_scenario(index, {**defaults, **scenario}) for index, scenario in enumerate(scenarios)]
+
+
+def complete_scenario(index, scenario, defaults=SCENARIO_DEFAULTS):
+    """Scenario dict with the defaults filled in; raises ValueError for unknown, missing or malformed keys."""
+    unknown = set(scenario) - SCENARIO_KEYS
+    if unknown:
+        raise ValueError(f"Scenario {index}: unknown keys {sorted(unknown)}")
+    missing = {"radius", "sim_time", "initial_pos", "initial_vel"} - set(scenario)
+    if missing:
+        raise ValueError(f"Scenario {index}: missing {sorted(missing)}")
+    scenario = {**defaults, "name": f"scenario_{index:05d}", **scenario}
+    for key in ("initial_pos", "initial_vel"):
+        try:
+            components = [float(v) for v in scenario[key]]
+        except (TypeError, ValueError):
+            components = None
+        if components is None or len(components) != 3:
+            raise ValueError(f"Scenario {index}: {key} needs three numeric components")
+    return scenario
+
+
+def run_scenario(scenario, out_dir=None, fmt="npz", cache_dir=None):
+    """
+    Simulates one scenario and writes its trajectory to out_dir.
+
+    Returns:
+        dict: Summary row (see SUMMARY_FIELDS); failures are reported in
+              the row instead of raised, so one bad scenario does not stop
+              the batch.
+    """
+    summary = dict.fromkeys(SUMMARY_FIELDS, "")
+    summary["name"] = scenario["name"]
+    start = time.perf_counter()
+    try:
+        cache = None
+        if cache_dir:
+            from cache import TrajectoryCache
+            cache = TrajectoryCache(cache_dir)
+        model = PhysicsModel(scenario["radius"], cache=cache)
+        args = (scenario["initial_pos"], scenario["initial_vel"], scenario["drive_force"],
+                scenario["sim_time"], scenario["mass"])
+        options = dict(integrator=scenario["integrator"], backend=scenario["backend"])
+        path = os.path.join(out_dir, f"{scenario['name']}.{fmt}") if out_dir else ""
+
+        if fmt == "csv":
+            stats = _write_csv(model.iter_trajectory(*args, chunk_size=CSV_CHUNK_SIZE, **options), path,
+                               scenario["radius"])
+        else:
+            result = model.calculate_trajectory(*args, **options)
+            if path and len(result):
+                result.save(path)
+            stats = _result_stats(result, scenario["radius"])
+        if stats["samples"] == 0:
+            raise ValueError("invalid parameters, no trajectory computed")
+        summary.update(stats, status="ok", output=path)
+    except Exception as e:
+        summary.update(status="error", error=str(e))
+    summary["seconds"] = round(time.perf_counter() - start, 6)
+    return summary
+
+
+def _first_detachment(time, contact, prev_contact):
+    """Time of the first wall contact -> flight transition, or "" if there is none."""
+    detached = np.flatnonzero(np.diff(contact.astype(np.int8), prepend=np.int8(prev_contact)) < 0)
+    return float(time[detached[0]]) if len(detached) else ""
+
+
+def _safety_stats(result):
+    """(max g-load, min critical margin on the wall or inf) of a result."""
+    channels = result.channels()
+    margins = channels['critical_margin'][result.contact]
+    return float(channels['g_load'].max()), float(margins.min()) if len(margins) else np.inf
+
+
+def _result_stats(result, radius):
+    if not len(result):
+        return dict(samples=0)
+    max_g_load, min_margin = _safety_stats(result)
+    return dict(samples=len(result), end_time=float(result.time[-1]),
+                detach_time=_first_detachment(result.time, result.contact, result.contact[0]),
+                min_height=float(result.positions[:, 1].min()) / radius, events=len(result.events),
+                max_g_load=max_g_load, min_critical_margin=min_margin if np.isfinite(min_margin) else "")
+
+
+def _write_csv(chunks, path, radius):
+    """Streams trajectory chunks to a CSV file; returns the summary statistics."""
+    samples = events = 0
+    detach_time = ""
+    prev_contact = None
+    min_y = np.inf
+    max_g_load = -np.inf
+    min_margin = np.inf
+    end_time = np.nan
+    f = open(path, "w", newline="") if path else None
+    try:
+        if f:
+            f.write("time,x,y,z,vx,vy,vz,contact\n")
+        for chunk in chunks:
+            if f:
+                table = np.column_stack([chunk.time, chunk.positions, chunk.velocities, chunk.contact])
+                np.savetxt(f, table, delimiter=",", fmt=["%.17g"] * 7 + ["%d"])
+            if detach_time == "":
+                first = chunk.contact[0] if prev_contact is None else prev_contact
+                detach_time = _first_detachment(chunk.time, chunk.contact, first)
+            prev_contact = chunk.contact[-1]
+            samples += len(chunk)
+            events += len(chunk.events)
+            min_y = min(min_y, float(chunk.positions[:, 1].min()))
+            chunk_g_load, chunk_margin = _safety_stats(chunk)
+            max_g_load = max(max_g_load, chunk_g_load)
+            min_margin = min(min_margin, chunk_margin)
+            end_time = float(chunk.time[-1])
+    finally:
+        if f:
+            f.close()
+    if not samples:
+        if path:
+            os.remove(path)
+        return dict(samples=0)
+    return dict(samples=samples, end_time=end_time, detach_time=detach_time,
+                min_height=min_y / radius, events=events, max_g_load=max_g_load,
+                min_critical_margin=min_margin if np.isfinite(min_margin) else "")
+
+
+def run_batch(scenarios, out_dir=None, fmt="npz", workers=None, cache_dir=None, on_result=None):
+    """
+    Runs scenarios, in parallel worker processes when workers > 1.
+
+    Args:
+        scenarios (list): Scenario dicts as returned by load_scenarios.
+        out_dir (str): Directory for trajectory files; None writes none.
+        fmt (str): "npz" or "csv".
+        workers (int): Worker processes (default: CPU count); 1 runs in-process.
+        cache_dir (str): Optional TrajectoryCache directory shared by the workers.
+        on_result (callable): Called with each summary row as it arrives.
+
+    Returns:
+        list: Summary rows in completion order.
+    """
+    if fmt not in ("npz", "csv"):
+        raise ValueError(f"Unknown format: {fmt}")
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, max(len(scenarios), 1))
+    rows = []
+    if workers == 1:
+        for scenario in scenarios:
+            rows.append(run_scenario(scenario, out_dir, fmt, cache_dir))
+            if on_result:
+                on_result(rows[-1])
+        return rows
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_scenario, scenario, out_dir, fmt, cache_dir) for scenario in scenarios]
+        for future in as_completed(futures):
+            rows.append(future.result())
+            if on_result:
+                on_result(rows[-1])
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m batch", description="Simulate scenarios without the GUI.")
+    parser.add_argument("scenarios", help=".json or .csv scenario file")
+    parser.add_argument("--out-dir", help="directory for trajectory files (default: summary only)")
+    parser.add_argument("--format", choices=("npz", "csv"), default="npz", help="trajectory file format")
+    parser.add_argument("--summary", help="summary CSV path (default: stdout)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--cache-dir", help="reuse results from a trajectory cache directory")
+    args = parser.parse_args(argv)
+
+    scenarios = load_scenarios(args.scenarios)
+    summary_file = open(args.summary, "w", newline="") if args.summary else sys.stdout
+    try:
+        writer = csv.DictWriter(summary_file, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+
+        def write_row(row):
+            writer.writerow(row)
+            summary_file.flush()
+
+        rows = run_batch(scenarios, args.out_dir, args.format, args.workers, args.cache_dir, write_row)
+    finally:
+        if summary_file is not sys.stdout:
+            summary_file.close()
+    failed = sum(row["status"] != "ok" for row in rows)
+    if failed:
+        print(f"{failed} of {len(rows)} scenarios failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# --- END OF FILE batch.py ---
@@ -0,0 +1,264 @@
+# --- START OF FILE benchmark.py ---
+
+"""
+Throughput benchmarks for the simulation and rendering hot paths.
+
+    python benchmark.py                       # run, print, compare with the stored baseline
+    python benchmark.py --quick               # short runs only (sim_time <= 60 s)
+    python benchmark.py --suite model --save-baseline
+    python benchmark.py --output report.json --compare other_report.json
+
+Model cases measure integration steps per second of
+PhysicsModel.calculate_trajectory over sim_time (1 s to 1 h), starting
+regimes, integrators and backends, plus rider-steps per second of
+calculate_ensemble for several batch sizes. Paint cases measure frames per
+second of SphereWidget.paintGL against trajectory length in an offscreen
+OpenGL context (see export.py); they are skipped when no context can be
+created. A case is reported as a regression when its rate drops by more than
+--threshold relative to the baseline; the exit status is then 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+from model import PhysicsModel
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json")
+
+RADIUS = 4.0
+MASS = 100.0
+# name: (initial_pos, initial_vel, drive_force)
+REGIMES = {
+    "inside": ((0.1, -3.0, 0.0), (0.0, 0.0, 2.0), 15.0),    # Falls, lands, rides the wall
+    "wall": ((0.1, -3.95, 0.0), (0.0, 0.0, 2.0), 15.0),     # Starts on the wall with drive
+    "detaching": ((4.0, 0.0, 0.0), (0.0, 3.0, 9.0), 0.0),   # Fast entry, leaves the wall repeatedly
+}
+SIM_TIMES = (1.0, 10.0, 60.0, 600.0, 3600.0)
+QUICK_SIM_TIMES = (1.0, 10.0, 60.0)
+# (integrator, backend, longest sim_time); the NumPy Euler loop takes ~30 s for one hour
+MODEL_VARIANTS = (("euler", "numpy", 3600.0), ("euler", "scalar", 3600.0), ("adaptive", "numpy", 600.0))
+BATCH_SIZES = (1, 16, 256)
+PAINT_LENGTHS = (1_000, 10_000, 100_000, 1_000_000)
+QUICK_PAINT_LENGTHS = (1_000, 10_000, 100_000)
+
+
+def _best_time(func, min_time=1.0, min_repeats=3, max_repeats=50):
+    """
+    Minimum wall time over repeated calls and the last return value.
+
+    Calls repeat until min_time seconds have been spent (and at least
+    min_repeats calls made); a first call longer than 2 s is not repeated.
+    The minimum is the least noisy estimate on a shared machine.
+    """
+    best = float("inf")
+    total = 0.0
+    for n in range(max_repeats):
+        start = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        total += elapsed
+        if (n == 0 and elapsed > 2.0) or (n + 1 >= min_repeats and total >= min_time):
+            break
+    return best, value
+
+
+def bench_model(sim_times=SIM_TIMES, batch_sizes=BATCH_SIZES):
+    """
+    Runs the model cases.
+
+    Returns:
+        list: Case dicts with name, params, seconds, count and rate (steps/s).
+    """
+    model = PhysicsModel(RADIUS)
+    results = []
+    for integrator, backend, longest in MODEL_VARIANTS:
+        for regime, (pos, vel, drive) in REGIMES.items():
+            for sim_time in sim_times:
+                if sim_time > longest:
+                    continue
+                run = lambda: model.calculate_trajectory(pos, vel, drive, sim_time, MASS,
+                                                         integrator=integrator, backend=backend)
+                seconds, result = _best_time(run)
+                steps = len(result) - 1
+                results.append(dict(name=f"model/{integrator}-{backend}/{regime}/T={sim_time:g}s",
+                                    params=dict(integrator=integrator, backend=backend, regime=regime,
+                                                sim_time=sim_time),
+                                    seconds=seconds, count=steps, rate=steps / seconds, unit="steps/s"))
+
+    sim_time = 10.0
+    rng = np.random.default_rng(0)
+    for batch in batch_sizes:
+        phi = rng.uniform(0, 2 * np.pi, batch)
+        positions = np.stack([np.full(batch, 0.1), np.full(batch, -3.95), np.zeros(batch)], axis=1)
+        velocities = np.stack([np.cos(phi), np.zeros(batch), np.sin(phi)], axis=1) * rng.uniform(1, 8, (batch, 1))
+        drives = np.full(batch, 15.0)
+        masses = np.full(batch, MASS)
+        run = lambda: model.calculate_ensemble(positions, velocities, drives, masses, sim_time)
+        seconds, (pos_out, _, _) = _best_time(run)
+        rider_steps = (len(pos_out) - 1) * batch
+        results.append(dict(name=f"model/ensemble/batch={batch}",
+                            params=dict(batch=batch, sim_time=sim_time),
+                            seconds=seconds, count=rider_steps, rate=rider_steps / seconds, unit="rider-steps/s"))
+    return results
+
+
+def bench_paint(lengths=PAINT_LENGTHS, frames=30, size=(1280, 720)):
+    """
+    Runs the paint cases in an offscreen context.
+
+    Each trajectory is drawn at `frames` timeline positions spread over its
+    length; the first paint (VBO upload and level-of-detail build) is
+    reported separately.
+
+    Returns:
+        list: Case dicts as for bench_model (rate in frames/s).
+    """
+    from PyQt5.QtWidgets import QApplication
+    from OpenGL.GL import glFinish, glViewport
+    from animation import SphereWidget
+    from export import create_offscreen_target
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    width, height = size
+    target = create_offscreen_target(width, height)
+    widget = SphereWidget()
+    widget.resize(width, height)
+    widget.initializeGL()
+    widget.resizeGL(width, height)
+    glViewport(0, 0, width, height)
+    widget.set_sphere_radius(RADIUS)
+
+    pos, vel, drive = REGIMES["wall"]
+    longest = max(lengths)
+    model = PhysicsModel(RADIUS)
+    trajectory = model.calculate_trajectory(pos, vel, drive, (longest - 1) * model.dt, MASS,
+                                            backend="scalar").positions
+
+    results = []
+    try:
+        for length in lengths:
+            widget.set_trajectory(trajectory[:length])
+            widget.set_current_frame(length - 1)
+            start = time.perf_counter()
+            widget.paintGL()
+            glFinish()
+            first = time.perf_counter() - start
+
+            frame_times = []
+            for frame in np.linspace(0, length - 1, frames).astype(int):
+                widget.set_current_frame(int(frame))
+                start = time.perf_counter()
+                widget.paintGL()
+                glFinish()
+                frame_times.append(time.perf_counter() - start)
+            median = float(np.median(frame_times))
+            results.append(dict(name=f"paint/frame/n={length}", params=dict(length=length, size=list(size)),
+                                seconds=median, count=1, rate=1.0 / median, unit="frames/s",
+                                p95_ms=1000 * float(np.percentile(frame_times, 95))))
+            results.append(dict(name=f"paint/first/n={length}", params=dict(length=length, size=list(size)),
+                                seconds=first, count=1, rate=1.0 / first, unit="frames/s"))
+    finally:
+        widget.release_gl_resources()
+    return results
+
+
+def environment():
+    """Machine and library versions recorded with every report."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return dict(python=platform.python_version(), numpy=np.__version__, platform=platform.platform(),
+                processor=platform.processor() or platform.machine(), cpu_count=os.cpu_count(),
+                commit=commit, date=time.strftime("%Y-%m-%dT%H:%M:%S"))
+
+
+def compare(report, baseline, threshold=0.25):
+    """
+    Compares rates case by case.
+
+    Returns:
+        list: (name, baseline_rate, rate, ratio, status) for cases in both
+              reports; status is "regression", "improvement" or "ok".
+    """
+    baseline_rates = {case["name"]: case["rate"] for case in baseline["results"]}
+    rows = []
+    for case in report["results"]:
+        if case["name"] not in baseline_rates:
+            continue
+        ratio = case["rate"] / baseline_rates[case["name"]]
+        status = "regression" if ratio < 1 - threshold else "improvement" if ratio > 1 + threshold else "ok"
+        rows.append((case["name"], baseline_rates[case["name"]], case["rate"], ratio, status))
+    return rows
+
+
+def format_report(report):
+    lines = [f"{'case':48s} {'rate':>14s} {'unit':14s} {'time (s)':>10s}"]
+    for case in report["results"]:
+        lines.append(f"{case['name']:48s} {case['rate']:14.4g} {case['unit']:14s} {case['seconds']:10.4f}")
+    return "\n".join(lines)
+
+
+def format_comparison(rows):
+    lines = [f"{'case':48s} {'baseline':>12s} {'current':>12s} {'ratio':>7s}  status"]
+    for name, base_rate, rate, ratio, status in rows:
+        lines.append(f"{name:48s} {base_rate:12.4g} {rate:12.4g} {ratio:7.2f}  {status}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation and rendering hot paths.")
+    parser.add_argument("--suite", choices=("model", "paint", "all"), default="all")
+    parser.add_argument("--quick", action="store_true", help="short runs only")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--compare", default=BASELINE_PATH, help="baseline report (default: stored baseline)")
+    parser.add_argument("--save-baseline", action="store_true", help="store this report as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown counted as regression")
+    args = parser.parse_args(argv)
+
+    results = []
+    if args.suite in ("model", "all"):
+        results += bench_model(QUICK_SIM_TIMES if args.quick else SIM_TIMES)
+    if args.suite in ("paint", "all"):
+        try:
+            results += bench_paint(QUICK_PAINT_LENGTHS if args.quick else PAINT_LENGTHS)
+        except Exception as e: # No display or no OpenGL context: the model numbers are still useful
+            print(f"Skipping paint benchmarks: {e}", file=sys.stderr)
+    report = dict(environment=environment(), results=results)
+    print(format_report(report))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"Saved baseline to {BASELINE_PATH}")
+        return 0
+
+    if args.compare and os.path.exists(args.compare):
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold)
+        print()
+        print(f"Compared with {args.compare} ({baseline['environment'].get('commit', '?')}, "
+              f"{baseline['environment'].get('date', '?')}):")
+        print(format_comparison(rows))
+        if any(status == "regression" for *_, status in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# --- END OF FILE benchmark.py ---
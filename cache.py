@@ -0,0 +1,145 @@
+# --- START OF FILE cache.py ---
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zipfile
+import zlib
+
+import numpy as np
+from trajectory import TrajectoryResult
+
+EVICT_TO = 0.9 # Eviction frees the cache down to this fraction of max_bytes
+STALE_TMP_AGE = 3600.0 # Seconds after which a partly written entry counts as left by a crash
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "sphere_simulator", "trajectories")
+
+
+class TrajectoryCache:
+    """
+    Persistent, content-addressed cache of trajectory results.
+
+    Every entry is a compressed .npz file named after the SHA-256 of the
+    simulation inputs. Hits refresh the file's modification time, and when
+    the directory grows beyond max_bytes the least recently used entries are
+    deleted. Several processes may share one directory: files are written
+    atomically and a lost eviction race is ignored. Unreadable (e.g.
+    truncated) entries count as misses and are deleted.
+
+    The size of the directory is scanned once and then kept as a running
+    total of the entries written, so the directory is listed again only
+    when the total exceeds max_bytes (entries of other processes are
+    counted from that scan on). Eviction then frees it down to EVICT_TO
+    of max_bytes, so the next scan is a number of puts away. Scans also
+    delete temporary files older than STALE_TMP_AGE, left by writers that
+    crashed.
+    """
+    def __init__(self, directory=None, max_bytes=512 * 1024**2):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self._size = None # Running total of the entry sizes, None until scanned
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(**inputs):
+        """Hash of the simulation inputs; float values are hashed by their exact repr."""
+        def normalize(value):
+            if isinstance(value, np.ndarray):
+                return [normalize(v) for v in value.tolist()]
+            if isinstance(value, (list, tuple)):
+                return [normalize(v) for v in value]
+            if isinstance(value, (float, np.floating)):
+                return repr(float(value))
+            if isinstance(value, (bool, np.bool_)):
+                return bool(value)
+            if isinstance(value, (int, np.integer)):
+                return repr(float(value))
+            return str(value)
+        payload = json.dumps({name: normalize(value) for name, value in inputs.items()}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """Returns the cached TrajectoryResult or None."""
+        path = self._path(key)
+        try:
+            result = TrajectoryResult.load(path)
+            os.utime(path) # Mark as recently used
+        except OSError:
+            return None
+        except (ValueError, KeyError, EOFError, zipfile.BadZipFile, zlib.error):
+            try:
+                os.remove(path) # Corrupt entry, e.g. left by a crash or a full disk
+            except FileNotFoundError:
+                pass
+            self._size = None
+            return None
+        return result
+
+    def put(self, key, result):
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                result.save(f)
+            size = os.path.getsize(tmp_path)
+            try:
+                size -= os.path.getsize(path) # Replaced entry
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self._size is None:
+            self._scan() # Counts the new entry as well
+        else:
+            self._size += size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _scan(self):
+        """(mtime, size, path) of every entry; updates the running size and removes stale temporary files."""
+        entries = []
+        stale = time.time() - STALE_TMP_AGE
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(".npz"):
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif entry.name.endswith(".tmp") and stat.st_mtime < stale:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+        self._size = sum(size for _, size, _ in entries)
+        return entries
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits into EVICT_TO * max_bytes."""
+        entries = self._scan()
+        total = self._size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                os.remove(entry.path)
+        self._size = 0
+
+# --- END OF FILE cache.py ---
@@ -0,0 +1,167 @@
+# --- START OF FILE export.py ---
+
+"""
+Headless frame export: renders a trajectory with the SphereWidget drawing
+code into an offscreen framebuffer, without showing any window.
+
+    python export.py trajectory.npz frames/ --every 10 --size 1280x720
+
+The .npz file is a TrajectoryResult written by TrajectoryResult.save().
+Without a display server run it under xvfb-run; LIBGL_ALWAYS_SOFTWARE=1
+selects Mesa's software rasterizer. Raw output is a single RGBA stream:
+
+    ffmpeg -f rawvideo -pix_fmt rgba -s 1280x720 -r 30 -i frames/frames.rgba out.mp4
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtGui import (QImage, QOffscreenSurface, QOpenGLContext, QOpenGLFramebufferObject,
+                         QOpenGLFramebufferObjectFormat, QSurfaceFormat)
+from OpenGL.GL import glFinish, glReadPixels, glViewport, GL_RGBA, GL_UNSIGNED_BYTE
+from animation import SphereWidget
+from trajectory import TrajectoryResult
+
+
+def create_offscreen_target(width, height):
+    """
+    Compatibility-profile GL context current on an offscreen surface, with
+    a bound framebuffer object of the requested size.
+
+    Returns:
+        tuple: (context, surface, fbo); keep references while rendering.
+    """
+    surface_format = QSurfaceFormat()
+    surface_format.setProfile(QSurfaceFormat.CompatibilityProfile)
+    surface_format.setDepthBufferSize(24)
+    surface = QOffscreenSurface()
+    surface.setFormat(surface_format)
+    surface.create()
+    context = QOpenGLContext()
+    context.setFormat(surface_format)
+    if not context.create() or not context.makeCurrent(surface):
+        raise RuntimeError("Could not create an offscreen OpenGL context")
+    fbo_format = QOpenGLFramebufferObjectFormat()
+    fbo_format.setAttachment(QOpenGLFramebufferObject.CombinedDepthStencil)
+    fbo_format.setSamples(0)
+    fbo = QOpenGLFramebufferObject(width, height, fbo_format)
+    fbo.bind()
+    return context, surface, fbo
+
+
+def read_frame(width, height):
+    """Current framebuffer as a top-down (height, width, 4) uint8 array."""
+    glFinish()
+    data = glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE)
+    return np.frombuffer(data, dtype=np.uint8).reshape(height, width, 4)[::-1]
+
+
+def _save_png(pixels, path):
+    height, width = pixels.shape[:2]
+    pixels = np.ascontiguousarray(pixels)
+    image = QImage(pixels.data, width, height, 4 * width, QImage.Format_RGBA8888)
+    if not image.save(path):
+        raise OSError(f"Could not write {path}")
+
+
+def render_frames(trajectory, out_dir, radius=None, every=1, size=(1280, 720), fmt="png",
+                  zoom=1.0, rotation=None, workers=4, target=None):
+    """
+    Renders every `every`-th frame of a trajectory to PNG files or a raw stream.
+
+    Rendering runs on the calling thread (it owns the GL context) while
+    encoding and disk writes run on a thread pool, so both overlap. At most
+    2 * workers frames are in flight.
+
+    Args:
+        trajectory: TrajectoryResult or (n, 3) array of positions.
+        out_dir (str): Output directory, created if missing.
+        radius (float): Sphere radius (default: trajectory.radius).
+        every (int): Frame stride.
+        size (tuple): (width, height) in pixels.
+        fmt (str): "png" (frame_000000.png, ...) or "raw" (frames.rgba, RGBA8 top-down).
+        zoom (float): Camera zoom as in SphereWidget.
+        rotation (QQuaternion): Scene rotation as in SphereWidget.
+        workers (int): Encoder threads (raw output always uses one writer).
+        target: Pre-made (context, surface, fbo); created when None.
+
+    Returns:
+        int: Number of frames written.
+    """
+    if fmt not in ("png", "raw"):
+        raise ValueError(f"Unknown format: {fmt}")
+    positions = trajectory.positions if isinstance(trajectory, TrajectoryResult) else trajectory
+    if radius is None:
+        radius = getattr(trajectory, "radius", None)
+        if radius is None:
+            raise ValueError("radius is required for plain position arrays")
+    width, height = size
+    os.makedirs(out_dir, exist_ok=True)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1]) # SphereWidget needs a QApplication
+    if target is None:
+        target = create_offscreen_target(width, height)
+
+    widget = SphereWidget()
+    widget.resize(width, height)
+    widget.zoom = zoom
+    if rotation is not None:
+        widget.rotation = rotation
+    widget.initializeGL()
+    widget.resizeGL(width, height)
+    glViewport(0, 0, width, height)
+    widget.set_sphere_radius(radius)
+    widget.set_trajectory(positions)
+
+    frames = range(0, len(widget.trajectory), max(1, int(every)))
+    raw_file = open(os.path.join(out_dir, "frames.rgba"), "wb") if fmt == "raw" else None
+    pending = []
+    try:
+        with ThreadPoolExecutor(max_workers=1 if raw_file else max(1, workers)) as pool:
+            for n_written, frame in enumerate(frames):
+                widget.set_current_frame(frame)
+                widget.paintGL()
+                pixels = read_frame(width, height)
+                if raw_file:
+                    pending.append(pool.submit(raw_file.write, pixels.tobytes()))
+                else:
+                    path = os.path.join(out_dir, f"frame_{n_written:06d}.png")
+                    pending.append(pool.submit(_save_png, pixels, path))
+                if len(pending) >= 2 * max(1, workers):
+                    pending.pop(0).result()
+            for future in pending:
+                future.result()
+    finally:
+        if raw_file:
+            raw_file.close()
+        widget.release_gl_resources()
+    return len(frames)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render trajectory frames without a window.")
+    parser.add_argument("trajectory", help=".npz written by TrajectoryResult.save()")
+    parser.add_argument("out_dir")
+    parser.add_argument("--every", type=int, default=1, help="render every N-th sample")
+    parser.add_argument("--size", default="1280x720", help="WIDTHxHEIGHT")
+    parser.add_argument("--format", choices=("png", "raw"), default="png")
+    parser.add_argument("--radius", type=float, help="sphere radius (default: from the file)")
+    parser.add_argument("--zoom", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    result = TrajectoryResult.load(args.trajectory)
+    n = render_frames(result, args.out_dir, radius=args.radius, every=args.every, size=(width, height),
+                      fmt=args.format, zoom=args.zoom, workers=args.workers)
+    print(f"Wrote {n} frames to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
+
+# --- END OF FILE export.py ---
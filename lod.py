@@ -0,0 +1,129 @@
+# --- START OF FILE lod.py ---
+
+import numpy as np
+
+BLOCK_SIZE = 4096 # Samples between vertices that every level keeps
+SEGMENT_BLOCKS = 64 # Blocks simplified per pass of TrajectoryLOD.update
+
+
+def simplify_polyline(points, tolerance, keep=None):
+    """
+    Ramer-Douglas-Peucker simplification of an (n, 3) polyline.
+
+    Every dropped vertex lies within `tolerance` of the simplified polyline.
+    Instead of recursing, each pass splits all still-open intervals at once
+    at their farthest vertex, so the cost is a few vectorized passes over
+    the points rather than one Python call per kept vertex.
+
+    Args:
+        points (np.ndarray): (n, 3) polyline vertices.
+        tolerance (float): Maximum distance of a dropped vertex.
+        keep (np.ndarray): Optional boolean mask of vertices that must be kept.
+
+    Returns:
+        np.ndarray: Sorted indices of the kept vertices (first and last always kept).
+    """
+    n = len(points)
+    keep = np.zeros(n, dtype=bool) if keep is None else keep.copy()
+    if n == 0:
+        return np.flatnonzero(keep)
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance * tolerance
+    open_points = ~keep # Vertices whose interval may still be split
+    while True:
+        candidates = np.flatnonzero(open_points)
+        if not len(candidates):
+            break
+        kept = np.flatnonzero(keep)
+        right = np.searchsorted(kept, candidates)
+        first = points[kept[right - 1]]
+        segment = points[kept[right]] - first
+        rel = points[candidates] - first
+        segment_len_sq = np.einsum('ij,ij->i', segment, segment)
+        t = np.einsum('ij,ij->i', rel, segment) / np.where(segment_len_sq > 0, segment_len_sq, 1.0)
+        rel -= np.clip(t, 0.0, 1.0)[:, None] * segment
+        dist_sq = np.einsum('ij,ij->i', rel, rel)
+
+        # Candidates are sorted, so each interval is a contiguous run
+        starts = np.flatnonzero(np.r_[True, right[1:] != right[:-1]])
+        group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(candidates)]))
+        group_max = np.maximum.reduceat(dist_sq, starts)
+        split = group_max > tolerance_sq
+        at_max = np.flatnonzero(dist_sq == group_max[group])
+        _, first_at_max = np.unique(group[at_max], return_index=True)
+        keep[candidates[at_max[first_at_max][split]]] = True
+        open_points[candidates[~split[group]]] = False
+        open_points &= ~keep
+    return np.flatnonzero(keep)
+
+
+class TrajectoryLOD:
+    """
+    Multi-resolution pyramid of a trajectory polyline for display.
+
+    Level 0 is the full trajectory. Level k (k >= 1) is simplified from
+    level k - 1 with tolerance base_tolerance * 2**(k - 1), so it deviates
+    from the original trajectory by less than max_error(k) = 2 * that
+    tolerance. Every BLOCK_SIZE-th sample is kept at all levels, so when a
+    trajectory grows update() only re-simplifies it from the last such
+    sample on.
+    """
+    def __init__(self, base_tolerance, n_levels=10, block_size=BLOCK_SIZE):
+        self.tolerances = [0.0] + [base_tolerance * 2**k for k in range(n_levels)]
+        self.block_size = block_size
+        self.points = np.empty((0, 3))
+        self._levels = [np.empty(0, dtype=np.intp) for _ in range(n_levels)]
+
+    @property
+    def n_levels(self):
+        return len(self.tolerances)
+
+    def max_error(self, level):
+        return 2.0 * self.tolerances[level]
+
+    def update(self, points):
+        """
+        Sets the trajectory. If it is longer than the previous one, the
+        samples they share must be unchanged; only the new part is simplified.
+
+        Returns:
+            int: First sample from which the levels were rebuilt; their
+                 indices below it are unchanged.
+        """
+        points = np.asarray(points).reshape(-1, 3)
+        n = len(points)
+        start = 0
+        if len(self.points) and n >= len(self.points):
+            start = (len(self.points) - 1) // self.block_size * self.block_size
+        self.points = points
+
+        # Simplified a segment at a time, so memory-mapped trajectories are
+        # never read into memory as a whole
+        new_levels = [[] for _ in self._levels]
+        segment_size = self.block_size * SEGMENT_BLOCKS
+        for segment_start in range(start, max(n - 1, start + 1), segment_size):
+            kept = np.arange(segment_start, min(segment_start + segment_size, n - 1) + 1)
+            for level, tolerance in enumerate(self.tolerances[1:]):
+                if len(kept) > 2:
+                    kept = kept[simplify_polyline(points[kept], tolerance, kept % self.block_size == 0)]
+                new_levels[level].append(kept[1:] if new_levels[level] else kept) # Segments share end points
+        for level, parts in enumerate(new_levels):
+            previous = self._levels[level]
+            self._levels[level] = np.concatenate([previous[previous < start]] + parts)
+        return start
+
+    def indices(self, level):
+        """Sorted indices of the trajectory samples kept at a level."""
+        if level == 0:
+            return np.arange(len(self.points))
+        return self._levels[level - 1]
+
+    def select_level(self, world_per_pixel, pixel_error=0.5):
+        """Coarsest level whose error stays below pixel_error pixels."""
+        level = 0
+        for k in range(1, self.n_levels):
+            if self.max_error(k) <= pixel_error * world_per_pixel:
+                level = k
+        return level
+
+# --- END OF FILE lod.py ---
@@ -1,19 +1,59 @@
+import logging
+import os
 import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                             QPushButton, QFormLayout, QLineEdit, QLabel,
-                            QSlider, QHBoxLayout, QMessageBox, QGroupBox)
-from PyQt5.QtCore import Qt
+                            QSlider, QHBoxLayout, QMessageBox, QGroupBox,
+                            QComboBox, QProgressBar, QDoubleSpinBox, QSpinBox, QFileDialog,
+                            QCheckBox)
+from PyQt5.QtCore import Qt, QTimer
 from animation import SphereWidget
 from model import PhysicsModel
+from trajectory import TrajectoryResult, RidersResult, ResultBuffer, CHANNEL_DTYPE
+from storage import open_trajectory
+from cache import TrajectoryCache
+from worker import SimulationWorker, RidersWorker
+from playback import PlaybackEngine, MIN_SPEED, MAX_SPEED, interpolate
+from profiling import PhaseProfiler
 import numpy as np
+from numpy.lib.recfunctions import structured_to_unstructured
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_DEBOUNCE_MS = 300 # Quiet time after the last edit before the preview starts
+PREVIEW_DT = 0.02 # Step of the coarse preview run (s), 4x the model step
+PREVIEW_HORIZON = 5.0 # Simulated time of the coarse preview run (s)
+CHANNEL_SAMPLE_LIMIT = 1 << 22 # Longer (memory-mapped) results derive the info panel channels per frame
+OVERLAY_VERTEX_CAP = 1000 # Vertices per compared trajectory, keeps hundreds of them interactive
 
 class AlgorithmWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, profile=False):
+        """
+        Args:
+            profile (bool): Time the simulation and paint phases and show
+                            them over the view (see profiling.py).
+        """
         super().__init__()
         self.setWindowTitle("Sphere Motion Simulator (Dynamic Model)")
 
         self.physics_model = None
-        self.trajectory = []
+        self.profiler = PhaseProfiler() if profile else None # Shared by all runs
+        self.trajectory_cache = TrajectoryCache()
+        self.sim_worker = None
+        self.result = TrajectoryResult.empty()
+        self.result_inputs = None # Inputs of self.result apart from sim_time, for extending it
+        self.riders = None # RidersResult of a multi-rider run; self.result is then its rider 0
+        self.riders_overlay = False # The compared trajectories are the paths of self.riders
+        self.pending_result = None # ResultBuffer of a refining run while the preview is still shown
+        self.streams = None # ResultBuffers the chunks of the running run are appended to (shown, riders)
+        self.preview_inputs = None # Inputs of the coarse preview being computed, refined when it completes
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DEBOUNCE_MS)
+        self.preview_timer.timeout.connect(self.start_preview)
+        self.trajectory = self.result.positions
+        self.velocities = self.result.velocities
+        self.channels = None # self.result.channels() when precomputed
 
 
         main_widget = QWidget()
@@ -23,12 +63,31 @@ class AlgorithmWindow(QMainWindow):
         left_widget = QWidget()
         left_layout = QVBoxLayout(left_widget)
         self.visualization = SphereWidget()
+        if profile:
+            self.visualization.set_profiling(True, overlay=True, extra=[self.profiler])
         left_layout.addWidget(self.visualization, stretch=1)
         self.timeline = QSlider(Qt.Horizontal)
         self.timeline.setRange(0, 100)
         self.timeline.setValue(0)
         self.timeline.valueChanged.connect(self.update_frame)
-        left_layout.addWidget(self.timeline)
+
+        self.playback = PlaybackEngine(parent=self)
+        self.playback.position_changed.connect(self.on_playback_position)
+        self.playback.playing_changed.connect(self.on_playing_changed)
+        playback_layout = QHBoxLayout()
+        self.play_btn = QPushButton("Воспроизвести")
+        self.play_btn.clicked.connect(self.playback.toggle)
+        playback_layout.addWidget(self.play_btn)
+        self.speed_input = QDoubleSpinBox()
+        self.speed_input.setRange(MIN_SPEED, MAX_SPEED)
+        self.speed_input.setSingleStep(0.1)
+        self.speed_input.setValue(1.0)
+        self.speed_input.setSuffix("×")
+        self.speed_input.valueChanged.connect(self.playback.set_speed)
+        playback_layout.addWidget(QLabel("Скорость:"))
+        playback_layout.addWidget(self.speed_input)
+        playback_layout.addWidget(self.timeline, stretch=1)
+        left_layout.addLayout(playback_layout)
         main_layout.addWidget(left_widget, stretch=3)
 
         right_widget = QWidget()
@@ -44,6 +103,20 @@ class AlgorithmWindow(QMainWindow):
         params_layout.addRow(QLabel("Сила тяги (Н):"), self.drive_force_input)
         self.time_input = QLineEdit("15.0")
         params_layout.addRow(QLabel("Время симуляции (сек):"), self.time_input)
+        self.integrator_input = QComboBox()
+        self.integrator_input.addItem("Эйлер (шаг 5 мс)", "euler")
+        self.integrator_input.addItem("Адаптивный (RK45)", "adaptive")
+        self.integrator_input.addItem("Симплектический на поверхности (шаг 5 мс)", "surface")
+        params_layout.addRow(QLabel("Интегратор:"), self.integrator_input)
+        self.riders_input = QSpinBox()
+        self.riders_input.setRange(1, 1000)
+        self.riders_input.setValue(1)
+        self.riders_input.setToolTip("Райдеры стартуют из начальных условий, повернутых вокруг оси Y "
+                                     "на равные углы; интегратор - Эйлер")
+        params_layout.addRow(QLabel("Число райдеров:"), self.riders_input)
+        self.live_preview_input = QCheckBox("Пересчитывать при вводе")
+        self.live_preview_input.setChecked(True)
+        params_layout.addRow(QLabel("Предпросмотр:"), self.live_preview_input)
         params_group.setLayout(params_layout)
         right_layout.addWidget(params_group)
 
@@ -84,12 +157,22 @@ class AlgorithmWindow(QMainWindow):
         self.info_pos_label = QLabel("Позиция (x,y,z): -")
         self.info_vel_label = QLabel("Скорость (vx,vy,vz): -")
         self.info_speed_label = QLabel("Скорость (скаляр): -")
+        self.info_margin_label = QLabel("Запас до критической скорости: -")
+        self.info_energy_label = QLabel("Энергия (кин. / пот. / полная): -")
+        self.info_normal_label = QLabel("Нормальная сила: -")
+        self.info_angle_label = QLabel("Широта / долгота: -")
         self.info_critical_label = QLabel("Критическая скорость: -")
+        self.info_riders_label = QLabel("Сближения райдеров: -")
         info_layout.addRow(self.info_critical_label)
         info_layout.addRow(self.info_time_label)
         info_layout.addRow(self.info_pos_label)
         info_layout.addRow(self.info_vel_label)
         info_layout.addRow(self.info_speed_label)
+        info_layout.addRow(self.info_margin_label)
+        info_layout.addRow(self.info_energy_label)
+        info_layout.addRow(self.info_normal_label)
+        info_layout.addRow(self.info_angle_label)
+        info_layout.addRow(self.info_riders_label)
         info_group.setLayout(info_layout)
         right_layout.addWidget(info_group)
 
@@ -97,12 +180,39 @@ class AlgorithmWindow(QMainWindow):
         self.calculate_btn.clicked.connect(self.calculate)
         right_layout.addWidget(self.calculate_btn)
 
+        self.cancel_btn = QPushButton("Остановить расчет")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_calculation)
+        right_layout.addWidget(self.cancel_btn)
+
+        self.open_btn = QPushButton("Открыть траекторию...")
+        self.open_btn.clicked.connect(self.open_saved_trajectory)
+        right_layout.addWidget(self.open_btn)
+
+        compare_layout = QHBoxLayout()
+        self.compare_btn = QPushButton("Сравнить траектории...")
+        self.compare_btn.setToolTip("Наложить сохраненные траектории (.npz): зеленые остаются на стенке, "
+                                    "красные отрываются")
+        self.compare_btn.clicked.connect(self.open_overlay_trajectories)
+        compare_layout.addWidget(self.compare_btn)
+        self.clear_compare_btn = QPushButton("Убрать наложение")
+        self.clear_compare_btn.clicked.connect(self.clear_overlay)
+        compare_layout.addWidget(self.clear_compare_btn)
+        right_layout.addLayout(compare_layout)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        right_layout.addWidget(self.progress_bar)
+
         right_layout.addStretch(1)
         right_widget.setLayout(right_layout)
         main_layout.addWidget(right_widget, stretch=1)
 
         self.radius_input.textChanged.connect(self.update_default_y)
         self.update_default_y(self.radius_input.text())
+        for line_edit in right_widget.findChildren(QLineEdit):
+            line_edit.textEdited.connect(self.schedule_preview) # User edits only, not setText
 
     def update_default_y(self, radius_text):
         try:
@@ -131,71 +241,51 @@ class AlgorithmWindow(QMainWindow):
         except ValueError:
             pass # Ignore if radius_text is not a valid float
 
-    def calculate(self):
-        try:
-            radius = float(self.radius_input.text())
-            mass = float(self.mass_input.text())
-            drive_force = float(self.drive_force_input.text())
-            sim_time = float(self.time_input.text())
-            initial_pos = (
-                float(self.initial_pos_x_input.text()),
-                float(self.initial_pos_y_input.text()),
-                float(self.initial_pos_z_input.text())
-            )
-            initial_vel = (
-                float(self.initial_vel_x_input.text()),
-                float(self.initial_vel_y_input.text()),
-                float(self.initial_vel_z_input.text())
-            )
+    def read_inputs(self, correct_fields=True):
+        """
+        Parses and validates the parameter fields.
 
-            if radius <= 0 or mass <= 0 or sim_time <= 0:
-                raise ValueError("Радиус, масса и время > 0.")
-            if drive_force < 0:
-                drive_force = 0
-                self.drive_force_input.setText("0.0")
-            pos_norm_sq = sum(p ** 2 for p in initial_pos)
-            if pos_norm_sq > radius ** 2 + 1e-3:
-                raise ValueError("Начальная позиция вне сферы.")
+        Args:
+            correct_fields (bool): Write corrected values (a negative drive
+                                   force becomes 0) back into the fields.
 
-            critical_speed = np.sqrt(9.81 * radius)
-            self.info_critical_label.setText(f"Критическая скорость: {critical_speed:.2f} м/с")
+        Returns:
+            tuple: (radius, mass, drive_force, sim_time, initial_pos, initial_vel)
 
-            self.physics_model = PhysicsModel(radius)
-            self.visualization.set_sphere_radius(radius)
-
-            results = self.physics_model.calculate_trajectory(
-                initial_pos, initial_vel, drive_force, sim_time, mass
-            )
-            if not isinstance(results, tuple) or len(results) != 2:
-                print("Warning: Model did not return expected (positions, velocities) tuple.")
-                if isinstance(results, list):
-                    self.trajectory = results
-                    self.velocities = []
-                else:
-                    raise ValueError("Model returned unexpected data format.")
-            else:
-                self.trajectory, self.velocities = results
-
-            if not self.trajectory:
-                QMessageBox.warning(self, "Предупреждение", "Не удалось сгенерировать траекторию.")
-                self.timeline.setRange(0, 0)
-                self.timeline.setValue(0)
-                self.visualization.set_trajectory([])
-                self.velocities = []
-                self.clear_info_labels()
-                return
+        Raises:
+            ValueError: With a message for the user if a field is invalid.
+        """
+        radius = float(self.radius_input.text())
+        mass = float(self.mass_input.text())
+        drive_force = float(self.drive_force_input.text())
+        sim_time = float(self.time_input.text())
+        initial_pos = (
+            float(self.initial_pos_x_input.text()),
+            float(self.initial_pos_y_input.text()),
+            float(self.initial_pos_z_input.text())
+        )
+        initial_vel = (
+            float(self.initial_vel_x_input.text()),
+            float(self.initial_vel_y_input.text()),
+            float(self.initial_vel_z_input.text())
+        )
 
-            print(f"Generated {len(self.trajectory)} trajectory points.")
-            self.visualization.set_trajectory(self.trajectory)
-            if len(self.trajectory) > 1:
-                self.timeline.setRange(0, len(self.trajectory) - 1)
-                self.timeline.setValue(0)
-                self.update_frame(0)
-            else:
-                self.timeline.setRange(0, 0)
-                self.timeline.setValue(0)
-                self.update_frame(0)
+        if radius <= 0 or mass <= 0 or sim_time <= 0:
+            raise ValueError("Радиус, масса и время > 0.")
+        if drive_force < 0:
+            drive_force = 0
+            if correct_fields:
+                self.drive_force_input.setText("0.0")
+        pos_norm_sq = sum(p ** 2 for p in initial_pos)
+        if pos_norm_sq > radius ** 2 + 1e-3:
+            raise ValueError("Начальная позиция вне сферы.")
+        return radius, mass, drive_force, sim_time, initial_pos, initial_vel
 
+    def calculate(self):
+        self.preview_timer.stop()
+        self.preview_inputs = None
+        try:
+            self.start_run(*self.read_inputs())
         except ValueError as e:
             QMessageBox.critical(self, "Ошибка ввода", str(e))
             self.clear_info_labels()
@@ -203,39 +293,365 @@ class AlgorithmWindow(QMainWindow):
             QMessageBox.critical(self, "Ошибка расчета", f"Произошла ошибка во время расчета:\n{e}")
             self.clear_info_labels()
 
+    def schedule_preview(self):
+        """Restarts the preview debounce after an edit; the running job is stale and stops right away."""
+        if not self.live_preview_input.isChecked():
+            return
+        self.preview_inputs = None
+        self.cancel_calculation()
+        self.preview_timer.start()
+
+    def start_preview(self):
+        """
+        Live preview of the edited inputs: a coarse Euler run over a short
+        horizon first, refined to the full run when it completes (see
+        on_calculation_completed). Multi-rider runs are only started by the button.
+        """
+        if self.riders_input.value() > 1:
+            return
+        try:
+            inputs = self.read_inputs(correct_fields=False)
+        except ValueError:
+            return # Still being typed
+        radius, mass, drive_force, sim_time, initial_pos, initial_vel = inputs
+        full_run = (radius, mass, drive_force, initial_pos, initial_vel, self.integrator_input.currentData(), 1, None)
+        if full_run == self.result_inputs and self.result.checkpoint is not None:
+            self.start_run(*inputs) # Only sim_time changed: the shown run is extended or recomputed directly
+            return
+        self.start_run(radius, mass, drive_force, min(sim_time, PREVIEW_HORIZON), initial_pos, initial_vel,
+                       dt=PREVIEW_DT, integrator="euler", n_riders=1, preview=True)
+        self.preview_inputs = inputs
+
+    def start_run(self, radius, mass, drive_force, sim_time, initial_pos, initial_vel, dt=None,
+                  integrator=None, n_riders=None, keep_shown=False, preview=False):
+        """
+        Starts a simulation in the background, replacing a running one.
+
+        Args:
+            dt (float): Integration step; None for the model default.
+            integrator (str), n_riders (int): Default to the selected ones.
+            keep_shown (bool): Keep showing the current result until the new
+                               run has caught up with it (preview refinement).
+            preview (bool): Coarse live preview; bypasses the trajectory cache,
+                            so throwaway runs do not evict stored ones.
+        """
+        critical_speed = np.sqrt(9.81 * radius)
+        self.info_critical_label.setText(f"Критическая скорость: {critical_speed:.2f} м/с")
+
+        cache = None if preview else self.trajectory_cache
+        if dt is None:
+            self.physics_model = PhysicsModel(radius, cache=cache, profiler=self.profiler)
+        else:
+            self.physics_model = PhysicsModel(radius, cache=cache, dt=dt, profiler=self.profiler)
+        self.visualization.set_sphere_radius(radius)
+
+        self.cancel_calculation()
+        integrator = integrator or self.integrator_input.currentData()
+        n_riders = n_riders or self.riders_input.value()
+        inputs = (radius, mass, drive_force, initial_pos, initial_vel, integrator, n_riders, dt)
+        # Euler runs know their length; other integrators grow the buffer by doubling
+        capacity = int(np.ceil(sim_time / self.physics_model.dt)) + 1 if integrator == "euler" else 0
+        stream = ResultBuffer(capacity, CHANNEL_SAMPLE_LIMIT)
+        # A longer (or interrupted) run with otherwise unchanged inputs continues where the shown one ends
+        base = None
+        self.pending_result = None
+        if (inputs == self.result_inputs and self.result.checkpoint is not None
+                and sim_time > self.result.checkpoint.time):
+            base = self.result
+            stream.append(base)
+        elif keep_shown and len(self.result):
+            self.pending_result = stream
+        else:
+            self.set_result(TrajectoryResult.empty())
+        self.streams = (stream, ResultBuffer(capacity) if n_riders > 1 else None)
+        self.result_inputs = inputs
+        self.set_riders(None)
+        if n_riders > 1:
+            positions, velocities = self.rider_start_states(initial_pos, initial_vel, n_riders)
+            self.sim_worker = RidersWorker(self.physics_model, positions, velocities, drive_force, mass,
+                                           sim_time, parent=self)
+        else:
+            self.sim_worker = SimulationWorker(
+                self.physics_model, initial_pos, initial_vel, drive_force, sim_time, mass,
+                parent=self, base=base, integrator=integrator
+            )
+        self.sim_worker.chunk_ready.connect(self.on_chunk_ready)
+        self.sim_worker.progress.connect(self.on_progress)
+        self.sim_worker.completed.connect(self.on_calculation_completed)
+        self.sim_worker.cancelled.connect(self.on_calculation_stopped)
+        self.sim_worker.failed.connect(self.on_calculation_failed)
+        self.sim_worker.finished.connect(self.on_worker_finished)
+        self.progress_bar.setValue(0)
+        self.cancel_btn.setEnabled(True)
+        self.sim_worker.start()
+
+    @staticmethod
+    def rider_start_states(initial_pos, initial_vel, n_riders):
+        """Initial conditions of n riders: the given ones rotated about the Y axis in equal steps."""
+        angles = np.arange(n_riders) * 2 * np.pi / n_riders
+        cos, sin = np.cos(angles), np.sin(angles)
+        def rotated(vector):
+            x, y, z = vector
+            return np.stack([x * cos + z * sin, np.full(n_riders, float(y)), z * cos - x * sin], axis=1)
+        return rotated(initial_pos), rotated(initial_vel)
+
+    def set_riders(self, riders):
+        """Sets the multi-rider result whose riders are drawn at the current frame (None for none)."""
+        self.riders = riders
+        if riders is None:
+            self.visualization.set_riders(np.empty((0, 3)))
+            self.info_riders_label.setText("Сближения райдеров: -")
+            if self.riders_overlay:
+                self.clear_overlay()
+
+    def open_overlay_trajectories(self):
+        """Draws saved results (e.g. of batch.py or the service) behind the current trajectory."""
+        paths, _ = QFileDialog.getOpenFileNames(self, "Сравнить траектории", "", "Траектории (*.npz)")
+        if not paths:
+            return
+        try:
+            results = [TrajectoryResult.load(path) for path in paths]
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.critical(self, "Ошибка открытия", f"Не удалось открыть траекторию:\n{e}")
+            return
+        self.visualization.set_overlay([result.positions for result in results],
+                                       contacts=[result.contact for result in results],
+                                       max_vertices=OVERLAY_VERTEX_CAP)
+        self.riders_overlay = False
+        logger.info("Comparing %d trajectories.", len(results))
+
+    def clear_overlay(self):
+        self.visualization.set_overlay([])
+        self.riders_overlay = False
+
+    def open_saved_trajectory(self):
+        """Shows a trajectory directory written by storage.TrajectoryWriter, memory-mapped."""
+        path = QFileDialog.getExistingDirectory(self, "Открыть траекторию (папка .traj)")
+        if not path:
+            return
+        try:
+            result = open_trajectory(path)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.critical(self, "Ошибка открытия", f"Не удалось открыть траекторию:\n{e}")
+            return
+        self.cancel_calculation()
+        self.sim_worker = None # Signals of the cancelled run are ignored from now on
+        self.preview_timer.stop()
+        self.preview_inputs = None
+        self.pending_result = None
+        self.result_inputs = None
+        self.set_riders(None)
+        if result.radius:
+            self.radius_input.setText(f"{result.radius:g}")
+            self.visualization.set_sphere_radius(result.radius)
+            self.info_critical_label.setText(f"Критическая скорость: {np.sqrt(9.81 * result.radius):.2f} м/с")
+        self.progress_bar.setValue(100)
+        self.set_result(result)
+        logger.info("Opened %s: %d trajectory points.", path, len(result))
+
+    def cancel_calculation(self):
+        if self.sim_worker is not None and self.sim_worker.isRunning():
+            self.sim_worker.cancel()
+        self.cancel_btn.setEnabled(False)
+
+    def set_result(self, result, extend=False):
+        """Shows a (possibly still growing) result, keeping the timeline position.
+
+        Args:
+            extend (bool): result continues the currently shown one.
+        """
+        self.result = result
+        self.trajectory = result.positions
+        self.velocities = result.velocities
+        # Derived once per result (chunks appended to it only add theirs), not on every frame
+        self.channels = (result.channels() if result.radius is not None and len(result) <= CHANNEL_SAMPLE_LIMIT
+                         else None)
+        frame = self.timeline.value()
+        self.visualization.set_trajectory(self.trajectory, extend=extend)
+        self.playback.set_time_column(result.time)
+        self.timeline.blockSignals(True)
+        self.timeline.setRange(0, max(len(result) - 1, 0))
+        self.timeline.setValue(min(frame, max(len(result) - 1, 0)))
+        self.timeline.blockSignals(False)
+        if not self.playback.is_playing(): # Otherwise the next playback tick redraws
+            self.update_frame(self.timeline.value())
+
+    def on_chunk_ready(self, chunk):
+        if self.sender() is not self.sim_worker:
+            return # Late chunk of a replaced run
+        stream, riders_stream = self.streams
+        if isinstance(chunk, RidersResult):
+            riders_stream.append(chunk)
+            stream.append(chunk.rider(0))
+            self.set_riders(riders_stream.result())
+            self.set_result(stream.result(), extend=True)
+            return
+        stream.append(chunk)
+        if self.pending_result is not None:
+            # The preview stays until the refined run has covered as much time
+            pending = stream.result()
+            if len(self.result) and pending.time[-1] < self.result.time[-1]:
+                return
+            self.pending_result = None
+            self.set_result(pending)
+            return
+        self.set_result(stream.result(), extend=True)
+
+    def on_progress(self, percent):
+        if self.sender() is self.sim_worker:
+            self.progress_bar.setValue(percent)
+
+    def on_calculation_completed(self, result):
+        if self.sender() is not self.sim_worker:
+            return
+        self.cancel_btn.setEnabled(False)
+        self.progress_bar.setValue(100)
+        if isinstance(result, RidersResult):
+            self.set_riders(result)
+            self.visualization.set_overlay(result.positions, contacts=result.contact,
+                                           max_vertices=OVERLAY_VERTEX_CAP)
+            self.riders_overlay = True
+            logger.info("%d riders: %d encounters, %d collisions.", result.n_riders, len(result.encounters),
+                        len(result.collisions()))
+            result = result.rider(0)
+        replaces_preview = self.pending_result is not None
+        self.pending_result = None
+        self.streams = None
+        if len(result) == 0:
+            QMessageBox.warning(self, "Предупреждение", "Не удалось сгенерировать траекторию.")
+            self.set_result(result)
+            self.clear_info_labels()
+            return
+        logger.info("Generated %d trajectory points.", len(result))
+        if self.profiler is not None:
+            logger.info("%s", self.profiler.format())
+        self.set_result(result, extend=not replaces_preview) # Otherwise the same samples as the streamed chunks
+        if self.preview_inputs is not None:
+            # Coarse preview done: refine to the full run at full resolution
+            inputs, self.preview_inputs = self.preview_inputs, None
+            self.start_run(*inputs, keep_shown=True)
+
+    def on_calculation_stopped(self):
+        if self.sender() is self.sim_worker:
+            self.cancel_btn.setEnabled(False)
+
+    def on_calculation_failed(self, message):
+        if self.sender() is not self.sim_worker:
+            return
+        self.cancel_btn.setEnabled(False)
+        self.preview_inputs = None
+        self.pending_result = None
+        QMessageBox.critical(self, "Ошибка расчета", f"Произошла ошибка во время расчета:\n{message}")
+        self.clear_info_labels()
+
+    def on_worker_finished(self):
+        worker = self.sender()
+        if worker is self.sim_worker:
+            self.sim_worker = None
+        worker.deleteLater()
+
+    def closeEvent(self, event):
+        self.playback.pause()
+        if self.sim_worker is not None:
+            self.sim_worker.cancel()
+            self.sim_worker.wait()
+        if self.profiler is not None:
+            logger.info("Profile:\n%s\n%s", self.profiler.format(), self.visualization.profiler.format())
+        super().closeEvent(event)
+
+    def on_playing_changed(self, playing):
+        self.play_btn.setText("Пауза" if playing else "Воспроизвести")
+
+    def on_playback_position(self, current_time, frame_index, fraction):
+        if frame_index >= len(self.trajectory):
+            return
+        self.timeline.blockSignals(True)
+        self.timeline.setValue(frame_index)
+        self.timeline.blockSignals(False)
+        self.show_frame(frame_index, fraction, current_time)
+
     def update_frame(self, value):
-        if self.trajectory:
-            max_frame = self.timeline.maximum()
+        if len(self.trajectory):
+            max_frame = min(self.timeline.maximum(), len(self.trajectory) - 1)
             frame_index = max(0, min(value, max_frame))
+            self.playback.seek(self.result.time[frame_index]) # Scrubbing moves playback too
+            self.show_frame(frame_index)
+        else:
+            self.clear_info_labels()
 
-            self.visualization.set_current_frame(frame_index)
-
-            pos = self.trajectory[frame_index]
-            time_step = 0.005
-            current_time = frame_index * time_step
+    def show_frame(self, frame_index, fraction=0.0, current_time=None):
+        """Shows the state `fraction` of the way from sample frame_index to the next one."""
+        if len(self.trajectory):
+            pos = interpolate(self.trajectory, frame_index, fraction)
+            self.visualization.set_current_frame(frame_index, pos if fraction else None)
+            if current_time is None:
+                current_time = self.result.time[frame_index]
+            if self.riders is not None and frame_index < len(self.riders):
+                self.show_riders(frame_index, fraction, current_time)
 
             self.info_time_label.setText(f"Время: {current_time:.3f} сек")
             self.info_pos_label.setText(f"Позиция (x,y,z): ({pos[0]:.3f}, {pos[1]:.3f}, {pos[2]:.3f})")
 
-            if self.velocities and frame_index < len(self.velocities):
-                vel = self.velocities[frame_index]
-                speed = np.linalg.norm(vel)
+            if frame_index < len(self.velocities):
+                vel = interpolate(self.velocities, frame_index, fraction)
                 self.info_vel_label.setText(f"Скорость (vx,vy,vz): ({vel[0]:.3f}, {vel[1]:.3f}, {vel[2]:.3f})")
-                self.info_speed_label.setText(f"Скорость (скаляр): {speed:.3f} м/с")
+                self.show_channels(frame_index, fraction)
             else:
                 self.info_vel_label.setText("Скорость (vx,vy,vz): -")
                 self.info_speed_label.setText("Скорость (скаляр): -")
         else:
             self.clear_info_labels()
 
+    def show_channels(self, frame_index, fraction):
+        """Shows the derived channels (see trajectory.derived_channels) at the current frame."""
+        if self.channels is not None:
+            rows = self.channels[frame_index:frame_index + 2]
+        elif self.result.radius is not None:
+            rows = self.result[frame_index:frame_index + 2].channels() # Too long to derive at once
+        else:
+            return
+        columns = structured_to_unstructured(rows, copy=True)
+        longitude = CHANNEL_DTYPE.names.index('longitude')
+        columns[:, longitude] = np.unwrap(columns[:, longitude]) # No jump across +-180 degrees between samples
+        values = dict(zip(CHANNEL_DTYPE.names, interpolate(columns, 0, fraction)))
+        self.info_speed_label.setText(f"Скорость (скаляр): {values['speed']:.3f} м/с")
+        self.info_margin_label.setText(f"Запас до критической скорости: {values['critical_margin']:+.3f} м/с")
+        self.info_energy_label.setText(f"Энергия (кин. / пот. / полная): {values['kinetic_energy']:.1f} / "
+                                       f"{values['potential_energy']:.1f} / {values['total_energy']:.1f} Дж")
+        self.info_normal_label.setText(f"Нормальная сила: {values['normal_force']:.1f} Н "
+                                       f"({values['g_load']:.2f} g)")
+        longitude = (values['longitude'] + np.pi) % (2 * np.pi) - np.pi
+        self.info_angle_label.setText(f"Широта / долгота: {np.degrees(values['latitude']):.1f}°, "
+                                      f"{np.degrees(longitude):.1f}°")
+
+    def show_riders(self, frame_index, fraction, current_time):
+        """Draws all riders, coloured by the encounters they are in at current_time."""
+        riders = self.riders
+        states = np.zeros(riders.n_riders, dtype=np.intp)
+        current = riders.encounters_at(current_time)
+        for state, records in ((1, current), (2, current[current['collision']])):
+            states[records['rider_a']] = state
+            states[records['rider_b']] = state
+        self.visualization.set_riders(interpolate(riders.positions, frame_index, fraction), states)
+        self.info_riders_label.setText(f"Сближения райдеров: {len(current)} сейчас, {len(riders.encounters)} "
+                                       f"всего, столкновений: {len(riders.collisions())}")
+
     def clear_info_labels(self):
         self.info_time_label.setText("Время: -")
         self.info_pos_label.setText("Позиция (x,y,z): -")
         self.info_vel_label.setText("Скорость (vx,vy,vz): -")
         self.info_speed_label.setText("Скорость (скаляр): -")
+        self.info_margin_label.setText("Запас до критической скорости: -")
+        self.info_energy_label.setText("Энергия (кин. / пот. / полная): -")
+        self.info_normal_label.setText("Нормальная сила: -")
+        self.info_angle_label.setText("Широта / долгота: -")
 
 
 if __name__ == "__main__":
+    # Silent by default; SPHERE_LOG_LEVEL=DEBUG shows every contact/detachment event.
+    # SPHERE_PROFILE=1 shows per-phase simulation and paint timings over the view.
+    logging.basicConfig(level=os.environ.get("SPHERE_LOG_LEVEL", "WARNING").upper(),
+                        format="%(asctime)s %(name)s %(levelname)s: %(message)s")
     app = QApplication(sys.argv)
     app.setStyleSheet("""
         QWidget {
@@ -281,6 +697,6 @@ if __name__ == "__main__":
             border-radius: 3px;
         }
     """)
-    window = AlgorithmWindow()
+    window = AlgorithmWindow(profile=os.environ.get("SPHERE_PROFILE", "") not in ("", "0"))
     window.show()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,113 @@
+# --- START OF FILE playback.py ---
+
+import numpy as np
+from PyQt5.QtCore import QObject, QTimer, QElapsedTimer, Qt, pyqtSignal
+
+MIN_SPEED = 0.1
+MAX_SPEED = 10.0
+MAX_TICK = 0.25 # s of wall time; longer stalls (window drags, breakpoints) do not jump ahead
+
+
+def sample_at(time, t):
+    """
+    Locates t in a sorted time column by binary search.
+
+    Returns:
+        tuple: (index, fraction) with time[index] <= t < time[index + 1] and
+               fraction in [0, 1); t outside the range is clamped to the ends.
+    """
+    n = len(time)
+    if n == 0:
+        return 0, 0.0
+    if t <= time[0]:
+        return 0, 0.0
+    if t >= time[-1]:
+        return n - 1, 0.0
+    index = int(np.searchsorted(time, t, side='right')) - 1
+    span = time[index + 1] - time[index]
+    return index, float((t - time[index]) / span) if span > 0 else 0.0
+
+
+def interpolate(values, index, fraction):
+    """Linear interpolation between values[index] and values[index + 1]."""
+    if fraction == 0.0 or index + 1 >= len(values):
+        return values[index]
+    return values[index] + fraction * (values[index + 1] - values[index])
+
+
+class PlaybackEngine(QObject):
+    """
+    Plays a trajectory back in real time, independent of the simulation step.
+
+    A timer ticks at the display rate and playback time advances by the
+    measured wall time times the speed, so when ticks arrive late or the
+    samples are denser than the display, samples are skipped rather than
+    playback slowing down. Samples are found by binary search on the time
+    column, so fixed-step and adaptive results play back alike.
+    """
+    position_changed = pyqtSignal(float, int, float) # Time, sample index, fraction to the next sample
+    playing_changed = pyqtSignal(bool)
+
+    def __init__(self, fps=60, parent=None):
+        super().__init__(parent)
+        self.time_column = np.empty(0)
+        self.current_time = 0.0
+        self.speed = 1.0
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(int(1000 / fps))
+        self.timer.timeout.connect(self._tick)
+        self.clock = QElapsedTimer()
+
+    def set_time_column(self, time):
+        """Sets the sample times of the result being played; keeps the playback time."""
+        self.time_column = np.asarray(time)
+        if not len(self.time_column):
+            self.pause()
+            self.current_time = 0.0
+
+    def set_speed(self, speed):
+        self.speed = max(MIN_SPEED, min(float(speed), MAX_SPEED))
+
+    def is_playing(self):
+        return self.timer.isActive()
+
+    def play(self):
+        if not len(self.time_column) or self.is_playing():
+            return
+        if self.current_time >= self.time_column[-1]:
+            self.current_time = float(self.time_column[0]) # Replay from the start
+        self.clock.start()
+        self.timer.start()
+        self.playing_changed.emit(True)
+
+    def pause(self):
+        if self.is_playing():
+            self.timer.stop()
+            self.playing_changed.emit(False)
+
+    def toggle(self):
+        if self.is_playing():
+            self.pause()
+        else:
+            self.play()
+
+    def seek(self, t):
+        """Moves playback to time t without emitting position_changed."""
+        if len(self.time_column):
+            t = max(float(self.time_column[0]), min(t, float(self.time_column[-1])))
+        self.current_time = t
+
+    def _tick(self):
+        elapsed = min(self.clock.restart() / 1000.0, MAX_TICK)
+        self.current_time += elapsed * self.speed
+        end = float(self.time_column[-1]) if len(self.time_column) else 0.0
+        at_end = self.current_time >= end
+        if at_end:
+            self.current_time = end
+        index, fraction = sample_at(self.time_column, self.current_time)
+        self.position_changed.emit(self.current_time, index, fraction)
+        if at_end:
+            self.pause()
+
+# --- END OF FILE playback.py ---
@@ -0,0 +1,169 @@
+# --- START OF FILE profiling.py ---
+
+"""
+Opt-in timing counters for the simulation loop and the paint path.
+
+    profiler = PhaseProfiler()
+    model = PhysicsModel(radius, profiler=profiler)
+    model.calculate_trajectory(...)
+    profiler.report()   # {'phases': {...}, 'steps': ..., 'steps_per_second': ...}
+    print(profiler.format())
+
+PhysicsModel adds the wall time and call count of each phase of its
+integration step (SIMULATION_PHASES) to the profiler attached to it;
+SphereWidget does the same for the parts of a frame (PAINT_PHASES) with a
+FrameProfiler, which also keeps the recent frame times for percentiles.
+Without a profiler (the default) nothing is timed.
+
+Each phase boundary costs one time.perf_counter() call, so the cheapest
+loops (the scalar Euler backend) run noticeably slower while profiled;
+the shares of the phases are still representative, absolute rates are
+what benchmark.py is for.
+"""
+
+import collections
+import time
+
+import numpy as np
+
+SIMULATION_PHASES = ("forces", "integration", "radius_correction", "constraints", "storage")
+PAINT_PHASES = ("setup", "wireframe", "overlay", "trajectory", "markers", "riders")
+FRAME_HISTORY = 1000 # Frame times kept for the percentiles
+
+
+class PhaseProfiler:
+    """
+    Cumulative seconds and call counts per phase, and the number of steps
+    they add up to.
+    """
+    def __init__(self, phases=SIMULATION_PHASES):
+        self.phases = tuple(phases)
+        self.reset()
+
+    def reset(self):
+        self.seconds = dict.fromkeys(self.phases, 0.0)
+        self.calls = dict.fromkeys(self.phases, 0)
+        self.steps = 0
+
+    def add(self, phase, seconds, calls=1):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + calls
+
+    def add_steps(self, seconds, steps, calls=None):
+        """
+        Adds the totals of `steps` steps.
+
+        Args:
+            seconds: Seconds per phase, in the order of self.phases.
+            steps (int): Steps they were accumulated over.
+            calls (dict): Calls of the phases not run once per step.
+        """
+        for phase, phase_seconds in zip(self.phases, seconds):
+            self.add(phase, phase_seconds, steps if calls is None else calls.get(phase, steps))
+        self.steps += steps
+
+    def timed(self, phase, func):
+        """func wrapped to add the time of every call to `phase`."""
+        clock = time.perf_counter
+        def wrapper(*args):
+            start = clock()
+            try:
+                return func(*args)
+            finally:
+                self.add(phase, clock() - start)
+        return wrapper
+
+    @property
+    def total_seconds(self):
+        return sum(self.seconds.values())
+
+    def report(self):
+        """
+        Returns:
+            dict: phases ({name: {seconds, calls, mean_us, share}}), seconds
+                  (all phases), steps and steps_per_second.
+        """
+        total = self.total_seconds
+        return dict(phases=self._phase_report(total), seconds=total, steps=self.steps,
+                    steps_per_second=self.steps / total if total > 0 else 0.0)
+
+    def _phase_report(self, total):
+        return {phase: dict(seconds=seconds, calls=self.calls[phase],
+                            mean_us=1e6 * seconds / self.calls[phase] if self.calls[phase] else 0.0,
+                            share=seconds / total if total > 0 else 0.0)
+                for phase, seconds in self.seconds.items()}
+
+    def format(self, title="Simulation"):
+        """Multi-line text summary, e.g. for logging or an overlay."""
+        report = self.report()
+        lines = [f"{title}: {report['steps']} steps, {report['steps_per_second']:.4g} steps/s"]
+        return "\n".join(lines + self._format_phases(report['phases']))
+
+    @staticmethod
+    def _format_phases(phases):
+        return [f"  {phase:18s} {stats['share']:6.1%} {stats['mean_us']:10.2f} us x {stats['calls']}"
+                for phase, stats in phases.items()]
+
+
+class FrameProfiler(PhaseProfiler):
+    """
+    Phase timing of rendered frames (begin_frame, lap per phase, end_frame)
+    plus the times of the last FRAME_HISTORY frames.
+
+    OpenGL calls only queue commands, so by default the phases measure the
+    time spent issuing them. With sync (e.g. glFinish) it is called before
+    every lap, which makes the phases include the GPU work at the cost of
+    stalling the pipeline.
+    """
+    def __init__(self, phases=PAINT_PHASES, sync=None, history=FRAME_HISTORY):
+        self.sync = sync
+        self.frame_times = collections.deque(maxlen=history)
+        super().__init__(phases)
+        self._frame_start = self._lap_start = None
+
+    def reset(self):
+        super().reset()
+        self.frame_times.clear()
+
+    def begin_frame(self):
+        self._frame_start = self._lap_start = time.perf_counter()
+
+    def lap(self, phase):
+        """Adds the time since the previous lap (or begin_frame) to `phase`."""
+        if self.sync is not None:
+            self.sync()
+        now = time.perf_counter()
+        self.add(phase, now - self._lap_start)
+        self._lap_start = now
+
+    def end_frame(self):
+        if self.sync is not None:
+            self.sync()
+        self.frame_times.append(time.perf_counter() - self._frame_start)
+        self.steps += 1
+
+    def report(self):
+        """
+        Returns:
+            dict: phases as for PhaseProfiler, seconds, frames, fps, and
+                  frame_ms (mean, p50, p95, p99, max over the recent frames).
+        """
+        total = self.total_seconds
+        frame_ms = 1000.0 * np.array(self.frame_times)
+        if len(frame_ms):
+            p50, p95, p99 = np.percentile(frame_ms, (50, 95, 99))
+            stats = dict(mean=float(frame_ms.mean()), p50=float(p50), p95=float(p95), p99=float(p99),
+                         max=float(frame_ms.max()))
+        else:
+            stats = dict.fromkeys(("mean", "p50", "p95", "p99", "max"), 0.0)
+        return dict(phases=self._phase_report(total), seconds=total, frames=self.steps, frame_ms=stats,
+                    fps=1000.0 / stats['mean'] if stats['mean'] > 0 else 0.0)
+
+    def format(self, title="Paint"):
+        report = self.report()
+        ms = report['frame_ms']
+        lines = [f"{title}: {report['frames']} frames, {report['fps']:.1f} fps",
+                 f"  frame ms p50 {ms['p50']:.2f}  p95 {ms['p95']:.2f}  p99 {ms['p99']:.2f}  max {ms['max']:.2f}"]
+        return "\n".join(lines + self._format_phases(report['phases']))
+
+# --- END OF FILE profiling.py ---
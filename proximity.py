@@ -0,0 +1,163 @@
+# --- START OF FILE proximity.py ---
+
+import itertools
+
+import numpy as np
+from trajectory import ENCOUNTER_DTYPE
+
+# Half of the 26 neighbouring cells (offsets lexicographically after the
+# cell itself): every pair of adjacent cells is then searched once
+_HALF_NEIGHBOURS = np.array([offset for offset in itertools.product((-1, 0, 1), repeat=3)
+                             if offset > (0, 0, 0)], dtype=np.int64)
+
+
+def close_pairs(points, distance):
+    """
+    All pairs of points closer than `distance`, found with a uniform grid.
+
+    Points are binned into cubic cells of edge `distance`, so a close pair
+    always lies in the same or in adjacent cells. The cells are hashed into
+    sorted integer keys and each point looks up its own and 13 neighbouring
+    cells by binary search; the cost grows with the number of points and
+    close pairs instead of with all n^2 pairs. For riders on the sphere
+    only the cells along the surface are ever occupied.
+
+    Args:
+        points (np.ndarray): (n, 3) positions.
+        distance (float): Pair distance threshold.
+
+    Returns:
+        tuple: (pairs, distances); pairs is an (m, 2) array of indices with
+               pairs[:, 0] < pairs[:, 1], sorted by first then second index.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    n = len(points)
+    if n < 2 or distance <= 0:
+        return np.empty((0, 2), dtype=np.intp), np.empty(0)
+
+    cells = np.floor(points / distance).astype(np.int64)
+    cells -= cells.min(axis=0) - 1 # Neighbouring cells of every point have non-negative coordinates
+    size = cells.max(axis=0) + 2
+    strides = np.array([size[1] * size[2], size[2], 1], dtype=np.int64)
+    keys = cells @ strides
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    rank = np.empty(n, dtype=np.intp)
+    rank[order] = np.arange(n)
+
+    # Candidates: later points of the same cell, all points of the half neighbourhood
+    neighbour_keys = keys[None, :] + (_HALF_NEIGHBOURS @ strides)[:, None]
+    lo = np.concatenate([rank + 1, np.searchsorted(sorted_keys, neighbour_keys.ravel(), 'left')])
+    hi = np.concatenate([np.searchsorted(sorted_keys, keys, 'right'),
+                         np.searchsorted(sorted_keys, neighbour_keys.ravel(), 'right')])
+    counts = hi - lo
+    first = np.repeat(np.tile(np.arange(n), len(_HALF_NEIGHBOURS) + 1), counts)
+    offsets = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    second = order[offsets + np.arange(len(first))]
+
+    delta = points[first] - points[second]
+    dist = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+    close = dist < distance
+    pairs = np.sort(np.stack([first[close], second[close]], axis=1), axis=1)
+    dist = dist[close]
+    by_pair = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    return pairs[by_pair], dist[by_pair]
+
+
+class NeighbourList:
+    """
+    Pairs of moving points closer than `distance`, updated every step.
+
+    A Verlet neighbour list: candidate pairs within distance + skin are
+    found with close_pairs and only their distances are checked, until some
+    point has moved more than skin / 2 since the candidates were built (no
+    other pair can have come within `distance` before that). With points
+    moving a small fraction of the distance per step, the grid is rebuilt
+    only every few steps. The result equals close_pairs(points, distance).
+    """
+    def __init__(self, distance, skin=None):
+        self.distance = distance
+        self.skin = 0.5 * distance if skin is None else skin
+        self.reference = None # Points when the candidates were built
+        self.candidates = np.empty((0, 2), dtype=np.intp)
+
+    def update(self, points):
+        """Returns (pairs, distances) as close_pairs does."""
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        if self.reference is None or self.reference.shape != points.shape or self._moved(points) > 0.5 * self.skin:
+            self.candidates, _ = close_pairs(points, self.distance + self.skin)
+            self.reference = points.copy()
+        delta = points[self.candidates[:, 0]] - points[self.candidates[:, 1]]
+        dist = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+        close = dist < self.distance
+        return self.candidates[close], dist[close]
+
+    def _moved(self, points):
+        delta = points - self.reference
+        return np.sqrt(np.max(np.einsum('ij,ij->i', delta, delta), initial=0.0))
+
+
+class EncounterTracker:
+    """
+    Turns the close pairs of consecutive samples into encounter records.
+
+    An encounter is a run of consecutive samples in which the same pair is
+    close (see ENCOUNTER_DTYPE); it is a collision if the pair came closer
+    than collision_distance.
+    """
+    def __init__(self, n_points, collision_distance):
+        self.n_points = n_points
+        self.collision_distance = collision_distance
+        self.codes = np.empty(0, dtype=np.int64) # first * n_points + second, sorted
+        self.start = np.empty(0)
+        self.min_distance = np.empty(0)
+        self.min_time = np.empty(0)
+        self.last_time = None
+        self.finished = []
+
+    def update(self, time, pairs, distances):
+        """Adds the close pairs (as returned by close_pairs) of the sample at `time`."""
+        codes = pairs[:, 0].astype(np.int64) * self.n_points + pairs[:, 1]
+        index = np.searchsorted(self.codes, codes)
+        known = index < len(self.codes)
+        known[known] = self.codes[index[known]] == codes[known]
+        index = index[known]
+
+        ended = np.ones(len(self.codes), dtype=bool)
+        ended[index] = False
+        if np.any(ended):
+            self._finish(ended)
+
+        start = np.full(len(codes), float(time))
+        min_distance = np.array(distances, dtype=float)
+        min_time = np.full(len(codes), float(time))
+        start[known] = self.start[index]
+        keep_min = self.min_distance[index] <= min_distance[known]
+        min_distance[known] = np.where(keep_min, self.min_distance[index], min_distance[known])
+        min_time[known] = np.where(keep_min, self.min_time[index], time)
+        self.codes, self.start, self.min_distance, self.min_time = codes, start, min_distance, min_time
+        self.last_time = float(time)
+
+    def close(self):
+        """Ends the encounters still in progress at the last sample."""
+        if len(self.codes):
+            self._finish(np.ones(len(self.codes), dtype=bool))
+            self.codes = self.codes[:0]
+
+    def pop_finished(self):
+        """Encounter records finished since the last call, ordered by end time."""
+        records = np.concatenate(self.finished) if self.finished else np.empty(0, dtype=ENCOUNTER_DTYPE)
+        self.finished = []
+        return records
+
+    def _finish(self, mask):
+        records = np.empty(int(np.count_nonzero(mask)), dtype=ENCOUNTER_DTYPE)
+        records['rider_a'], records['rider_b'] = np.divmod(self.codes[mask], self.n_points)
+        records['start'] = self.start[mask]
+        records['end'] = self.last_time
+        records['min_distance'] = self.min_distance[mask]
+        records['min_time'] = self.min_time[mask]
+        records['collision'] = records['min_distance'] < self.collision_distance
+        self.finished.append(records)
+
+# --- END OF FILE proximity.py ---
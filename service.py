@@ -0,0 +1,386 @@
+# --- START OF FILE service.py ---
+
+"""
+Local simulation service: one warm simulator shared by several tools.
+
+    python -m service --port 8765 --workers 4 --cache-dir ~/.cache/sphere_simulator/trajectories
+    python -m service --unix /tmp/sphere.sock
+
+    curl -s localhost:8765/simulate -o run.npz \\
+         -d '{"radius": 4, "sim_time": 8, "initial_pos": [0.1, -3.95, 0], "initial_vel": [0, 0, 2]}'
+
+Endpoints:
+
+    POST /simulate   one scenario object (keys as in batch.py) -> the
+                     TrajectoryResult as .npz (TrajectoryResult.load reads
+                     it; ?compress=0 skips the compression)
+    GET  /status     request, batch and cache counters as JSON
+
+Requests that arrive within BATCH_WINDOW of each other are collected into
+one batch. Euler scenarios with the "ensemble" backend (the default here)
+that share the radius and sim_time are advanced together by
+PhysicsModel.calculate_ensemble, one vectorized step for the whole group;
+ensemble runs agree with the numpy Euler loop to rounding and do not
+depend on which other riders share the batch, but carry no event log
+(the contact transitions are still in event_indices) and no checkpoint,
+so they cannot be extended; their responses say so in an X-Result-Omits
+header. Request backend "numpy" for both. Other scenarios
+run one by one through calculate_trajectory. Groups go to a pool of
+worker processes that stay alive between requests, so NumPy and the
+model are imported once per worker instead of once per tool.
+
+Identical requests in flight at the same time are computed once. With a
+cache directory the workers look results up in a TrajectoryCache first
+and store what they computed.
+
+simulate() is a small client for tools written in Python.
+"""
+
+import argparse
+import collections
+import io
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from batch import SCENARIO_DEFAULTS, complete_scenario
+from model import PhysicsModel
+from trajectory import TrajectoryResult
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+SERVICE_DEFAULTS = dict(SCENARIO_DEFAULTS, backend="ensemble")
+BACKENDS = ("ensemble", "numpy", "scalar")
+ENSEMBLE_OMITS = "events, checkpoint" # Parts of a result the ensemble backend does not compute
+BATCH_WINDOW = 0.005 # Seconds a batch stays open for further requests
+MAX_BATCH = 1024 # Requests per batch
+MAX_BODY = 1 << 20 # Bytes of a request body
+DEFAULT_PORT = 8765
+
+
+def _serialize(result, compressed):
+    buffer = io.BytesIO()
+    result.save(buffer, compressed)
+    return buffer.getvalue()
+
+
+def _ensemble_result(radius, dt, positions, velocities, contact, k, mass):
+    """Rider k of a calculate_ensemble run as a TrajectoryResult of its own."""
+    return TrajectoryResult(positions[:, k].copy(), velocities[:, k].copy(), np.arange(len(positions)) * dt,
+                            contact[:, k].copy(), radius=radius, mass=mass)
+
+
+def run_group(scenarios, keys, cache_dir=None, compressed=True):
+    """
+    Runs a group of scenarios in a worker process.
+
+    The group is either one scenario or ensemble scenarios sharing radius
+    and sim_time, which are computed with a single calculate_ensemble call.
+
+    Returns:
+        tuple: (outputs, cache_hits); outputs holds ("ok", npz bytes) or
+               ("error", message) per scenario.
+    """
+    cache = None
+    if cache_dir:
+        from cache import TrajectoryCache
+        cache = TrajectoryCache(cache_dir)
+    results = [cache.get(key) if cache is not None else None for key in keys]
+    cache_hits = sum(result is not None for result in results)
+    missing = [i for i, result in enumerate(results) if result is None]
+    outputs = [None] * len(scenarios)
+
+    if missing and scenarios[0]["backend"] == "ensemble" and scenarios[0]["integrator"] == "euler":
+        model = PhysicsModel(scenarios[0]["radius"])
+        group = [scenarios[i] for i in missing]
+        try:
+            positions, velocities, contact = model.calculate_ensemble(
+                [s["initial_pos"] for s in group], [s["initial_vel"] for s in group],
+                [s["drive_force"] for s in group], [s["mass"] for s in group], group[0]["sim_time"])
+        except ValueError as e:
+            if len(group) > 1:
+                # One bad rider fails the whole ensemble; run them apart to tell which
+                for i in missing:
+                    (outputs[i],), _ = run_group([scenarios[i]], [keys[i]], cache_dir, compressed)
+                return outputs, cache_hits
+            outputs[missing[0]] = ("error", str(e))
+            return outputs, cache_hits
+        for k, i in enumerate(missing):
+            results[i] = _ensemble_result(model.radius, model.dt, positions, velocities, contact, k,
+                                          float(group[k]["mass"]))
+    else:
+        for i in missing:
+            scenario = scenarios[i]
+            try:
+                model = PhysicsModel(scenario["radius"])
+                backend = "numpy" if scenario["backend"] == "ensemble" else scenario["backend"]
+                results[i] = model.calculate_trajectory(scenario["initial_pos"], scenario["initial_vel"],
+                                                        scenario["drive_force"], scenario["sim_time"],
+                                                        scenario["mass"], integrator=scenario["integrator"],
+                                                        backend=backend)
+            except Exception as e:
+                outputs[i] = ("error", str(e))
+
+    for i, result in enumerate(results):
+        if outputs[i] is not None:
+            continue
+        if not len(result):
+            outputs[i] = ("error", "invalid parameters, no trajectory computed")
+            continue
+        if cache is not None and i in missing:
+            cache.put(keys[i], result)
+        outputs[i] = ("ok", _serialize(result, compressed))
+    return outputs, cache_hits
+
+
+class SimulationService:
+    """
+    Collects scenario requests into batches and runs them on a process pool.
+
+    submit() returns a concurrent.futures.Future with the .npz bytes of the
+    result; it is safe to call from many threads (one per HTTP connection).
+    """
+    def __init__(self, workers=None, cache_dir=None, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.cache_dir = cache_dir
+        self.window = window
+        self.max_batch = max_batch
+        self.pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self.queue = queue.Queue()
+        self.pending = {} # (cache key, compressed) -> Future of a request in flight
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        self.collector = threading.Thread(target=self._collect, name="service-batcher", daemon=True)
+        self.collector.start()
+
+    def submit(self, scenario, compressed=True):
+        """
+        Queues a scenario (keys as in batch.py; backend defaults to "ensemble").
+
+        Raises:
+            ValueError: If the scenario is malformed.
+        """
+        try:
+            scenario = complete_scenario(0, scenario, SERVICE_DEFAULTS)
+            if scenario["backend"] not in BACKENDS:
+                raise ValueError(f"Unknown backend: {scenario['backend']}")
+            model = PhysicsModel(float(scenario["radius"]))
+            key = model.cache_key(scenario["initial_pos"], scenario["initial_vel"], float(scenario["drive_force"]),
+                                  float(scenario["sim_time"]), float(scenario["mass"]),
+                                  integrator=scenario["integrator"], backend=scenario["backend"])
+        except TypeError as e:
+            raise ValueError(f"Malformed scenario: {e}") from None
+        with self.lock:
+            self.stats["requests"] += 1
+            future = self.pending.get((key, compressed))
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future
+            future = Future()
+            self.pending[key, compressed] = future
+        self.queue.put((key, compressed, scenario, future))
+        return future
+
+    def status(self):
+        with self.lock:
+            return dict(self.stats, in_flight=len(self.pending))
+
+    def close(self):
+        self.queue.put(None)
+        self.collector.join()
+        self.pool.shutdown()
+
+    def _collect(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None) # Stop after this batch
+                    break
+                batch.append(item)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        groups = {}
+        for item in batch:
+            key, compressed, scenario, _ = item
+            if scenario["backend"] == "ensemble" and scenario["integrator"] == "euler":
+                group = ("ensemble", scenario["radius"], scenario["sim_time"], compressed)
+            else:
+                group = (key, compressed)
+            groups.setdefault(group, []).append(item)
+        with self.lock:
+            self.stats["batches"] += 1
+            self.stats["groups"] += len(groups)
+        for items in groups.values():
+            try:
+                task = self.pool.submit(run_group, [item[2] for item in items], [item[0] for item in items],
+                                        self.cache_dir, items[0][1])
+            except RuntimeError as e: # Pool shut down
+                self._deliver(items, None, error=e)
+                continue
+            task.add_done_callback(lambda task, items=items: self._deliver(items, task))
+
+    def _deliver(self, items, task, error=None):
+        outputs = None
+        if task is not None:
+            try:
+                outputs, cache_hits = task.result()
+            except Exception as e: # e.g. a crashed worker process
+                error = e
+        with self.lock:
+            if outputs is not None:
+                self.stats["cache_hits"] += cache_hits
+            for item in items:
+                self.pending.pop((item[0], item[1]), None)
+        for index, (_, _, _, future) in enumerate(items):
+            if outputs is None:
+                future.set_exception(RuntimeError(f"Simulation failed: {error}"))
+            elif outputs[index][0] == "ok":
+                future.set_result(outputs[index][1])
+            else:
+                future.set_exception(ValueError(outputs[index][1]))
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive: tools can reuse one connection for many requests
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path != "/status":
+            return self._send_error(404, "Not found")
+        self._send(200, "application/json", json.dumps(self.server.service.status()).encode())
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/simulate":
+            return self._send_error(404, "Not found")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            return self._send_error(413, "Request body too large")
+        compressed = urllib.parse.parse_qs(url.query).get("compress", ["1"])[-1] not in ("0", "false")
+        try:
+            scenario = json.loads(self.rfile.read(length))
+            if not isinstance(scenario, dict):
+                raise ValueError("Expected one scenario object")
+            data = self.server.service.submit(scenario, compressed).result()
+        except ValueError as e: # Includes malformed JSON
+            return self._send_error(400, str(e))
+        except Exception as e:
+            logger.exception("Simulation request failed")
+            return self._send_error(500, str(e))
+        scenario = {**SERVICE_DEFAULTS, **scenario}
+        headers = {}
+        if scenario["backend"] == "ensemble" and scenario["integrator"] == "euler":
+            headers["X-Result-Omits"] = ENSEMBLE_OMITS
+        self._send(200, "application/octet-stream", data, headers)
+
+    def _send_error(self, status, message):
+        self._send(status, "application/json", json.dumps(dict(error=message)).encode())
+
+    def _send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        self.service = service
+        super().__init__(address, ServiceHandler)
+
+
+class UnixServiceServer(ServiceServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address) # Left by a previous run
+        socketserver.TCPServer.server_bind(self) # HTTPServer.server_bind expects (host, port)
+        self.server_name, self.server_port = "localhost", 0
+
+
+def simulate(scenario, url=f"http://127.0.0.1:{DEFAULT_PORT}", timeout=None):
+    """
+    Runs a scenario on a running service.
+
+    Returns:
+        TrajectoryResult: The result, read into memory; with the default
+                          "ensemble" backend it has no events and no
+                          checkpoint (set "backend": "numpy" for them).
+
+    Raises:
+        ValueError: If the service rejected the scenario.
+    """
+    request = urllib.request.Request(url.rstrip("/") + "/simulate", data=json.dumps(scenario).encode(),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return TrajectoryResult.load(io.BytesIO(response.read()))
+    except urllib.error.HTTPError as e:
+        if e.code == 400:
+            raise ValueError(json.loads(e.read()).get("error")) from None
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m service", description="Serve simulations to local tools.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: localhost only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--cache-dir", help="reuse results from a trajectory cache directory")
+    parser.add_argument("--window", type=float, default=BATCH_WINDOW * 1000, help="batching window in ms")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.environ.get("SPHERE_LOG_LEVEL", "INFO"))
+
+    service = SimulationService(args.workers, args.cache_dir, args.window / 1000)
+    server = UnixServiceServer(args.unix, service) if args.unix else ServiceServer((args.host, args.port), service)
+    logger.info("Serving on %s", args.unix or f"http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# --- END OF FILE service.py ---
@@ -0,0 +1,228 @@
+# --- START OF FILE solver.py ---
+
+"""
+Inverse problems: the smallest drive force or entry speed that keeps the
+rider on the wall for the whole horizon.
+
+    python -m solver --radius 4 --mass 100 --sim-time 10 --latitude -30 --speed 3
+    python -m solver --radius 4 --mass 100 --sim-time 10 --latitude -60 0 30 --drive-force 200 --solve speed
+
+The rider starts on the wall at a latitude (degrees, 0 = equator) moving
+horizontally with the entry speed in the direction of the drive force,
+as in sweep.evaluate_point. Unlike the critical speed sqrt(g R) shown in
+the GUI, the answer accounts for the drive force, the latitude and the
+whole horizon, with detachment judged by the normal force as in the
+adaptive integrator.
+
+Every round evaluates `candidates` values per problem in one vectorized
+run of riders held on the wall (PhysicsModel.detachment_times), where
+each candidate stops being simulated once its normal force turns
+negative. The first round tries zero and a geometric ladder of values;
+once a staying value is found, each round splits the bracket between the
+largest value known to detach and the smallest known to stay into
+candidates + 1 parts, until it is narrower than the tolerance. This
+assumes that raising the value never makes the rider detach sooner; a
+problem where a value detaches above one that stays is reported as not
+monotonic instead of being given a value.
+
+With a cache (any mapping, e.g. a dict kept between calls or a
+shelve.Shelf), evaluations are remembered as (horizon simulated,
+detachment time), so they also answer later solves with a shorter or
+(once detached) longer horizon.
+"""
+
+import argparse
+import sys
+
+import numpy as np
+from model import PhysicsModel
+
+DEFAULT_CANDIDATES = 8 # Values evaluated per problem and round
+GROWTH = 4.0 # Ratio of consecutive values while no staying value is known
+MAX_GROWTH = GROWTH**8 # Values beyond first guess * MAX_GROWTH are not tried
+
+
+class SolveResult:
+    """
+    Smallest value that keeps the rider on the wall, per starting latitude.
+
+    `value` is NaN where no value up to the search limit stays on the wall
+    or where `monotonic` is False (a value detached above one that stayed,
+    so no bracket holds); `lower` is the largest value seen to detach (the
+    minimum lies in (lower, value]; both are 0 if the rider stays without
+    help).
+    """
+    __slots__ = ('latitudes', 'value', 'lower', 'monotonic', 'evaluations', 'rounds')
+
+    def __init__(self, latitudes, value, lower, monotonic, evaluations, rounds):
+        self.latitudes = latitudes
+        self.value = value
+        self.lower = lower
+        self.monotonic = monotonic
+        self.evaluations = evaluations
+        self.rounds = rounds
+
+    def __repr__(self):
+        return f"SolveResult(value={self.value}, evaluations={self.evaluations}, rounds={self.rounds})"
+
+
+def _start_states(radius, latitudes, speeds):
+    latitudes = np.radians(latitudes)
+    positions = np.stack([radius * np.cos(latitudes), radius * np.sin(latitudes), np.zeros_like(latitudes)], axis=1)
+    velocities = np.stack([np.zeros_like(speeds), np.zeros_like(speeds), speeds], axis=1)
+    return positions, velocities
+
+
+def _stays(model, mass, sim_time, latitudes, speeds, drive_forces, cache):
+    """Whether each candidate keeps wall contact for the horizon (all arguments but the cache are (n,) arrays)."""
+    positions, velocities = _start_states(model.radius, latitudes, speeds)
+    horizon = int(sim_time / model.dt) * model.dt if sim_time > 0 else 0.0
+    detach_time = np.full(len(latitudes), np.nan)
+    keys = None
+    if cache is not None:
+        # Horizon-free keys: an entry holds how far the run was simulated and when it detached
+        keys = [model.cache_key(positions[i], velocities[i], drive_forces[i], None, mass, backend="wall")
+                for i in range(len(latitudes))]
+        for i, key in enumerate(keys):
+            entry = cache.get(key)
+            if entry is not None and (entry[1] <= horizon or entry[0] >= horizon):
+                detach_time[i] = entry[1]
+    missing = np.flatnonzero(np.isnan(detach_time))
+    if len(missing):
+        detach_time[missing] = model.detachment_times(positions[missing], velocities[missing], drive_forces[missing],
+                                                      mass, sim_time)
+        if cache is not None:
+            for i in missing:
+                cache[keys[i]] = (horizon, float(detach_time[i]))
+    return detach_time > horizon, len(missing)
+
+
+def _solve(model, mass, sim_time, start_latitude, fixed, solve_for, first_guess, tolerance, candidates, max_value,
+           cache):
+    latitudes = np.asarray(start_latitude, dtype=float)
+    flat = latitudes.ravel()
+    n = len(flat)
+    if candidates < 2:
+        raise ValueError("candidates must be at least 2")
+    if max_value is None:
+        max_value = first_guess * MAX_GROWTH
+    lower = np.zeros(n)
+    value = np.full(n, np.inf) # Smallest value known to stay
+    detached = np.full(n, -np.inf) # Largest value known to detach
+    monotonic = np.ones(n, dtype=bool)
+    ladder = np.minimum(first_guess * GROWTH**np.arange(candidates - 1), max_value)
+    values = np.tile(np.concatenate([[0.0], ladder]), (n, 1))
+    rows = np.arange(n)
+    evaluations = rounds = 0
+    while len(rows):
+        row_latitudes = np.repeat(flat[rows], candidates)
+        fixed_values = np.full(values.size, float(fixed))
+        if solve_for == "speed":
+            speeds, drive_forces = values.ravel(), fixed_values
+        else:
+            speeds, drive_forces = fixed_values, values.ravel()
+        stays, computed = _stays(model, mass, sim_time, row_latitudes, speeds, drive_forces, cache)
+        stays = stays.reshape(values.shape)
+        evaluations += computed
+        rounds += 1
+
+        value[rows] = np.minimum(value[rows], np.where(stays, values, np.inf).min(axis=1))
+        detached[rows] = np.maximum(detached[rows], np.where(stays, -np.inf, values).max(axis=1))
+        lower[rows] = np.maximum(lower[rows], detached[rows])
+        # A detaching value above a staying one: the bracket would be meaningless
+        monotonic[rows] = detached[rows] < value[rows]
+
+        bracketed = np.isfinite(value[rows])
+        largest = values.max(axis=1)
+        ladder = np.minimum(largest[:, None] * GROWTH**np.arange(1, candidates + 1), max_value)
+        fractions = np.arange(1, candidates + 1) / (candidates + 1)
+        split = lower[rows, None] + (value[rows] - lower[rows])[:, None] * fractions
+        values = np.where(bracketed[:, None], split, ladder)
+        keep = monotonic[rows] & np.where(bracketed, value[rows] - lower[rows] > tolerance, largest < max_value)
+        rows, values = rows[keep], values[keep]
+
+    value[np.isinf(value) | ~monotonic] = np.nan
+    return SolveResult(latitudes, value.reshape(latitudes.shape), lower.reshape(latitudes.shape),
+                       monotonic.reshape(latitudes.shape), evaluations, rounds)
+
+
+def minimum_drive_force(model, mass, sim_time, start_latitude=0.0, entry_speed=0.0, tolerance=0.5,
+                        candidates=DEFAULT_CANDIDATES, max_force=None, cache=None):
+    """
+    Smallest drive force that keeps the rider on the wall.
+
+    Args:
+        model (PhysicsModel): Sphere and integration step.
+        mass (float): Mass of the rider (kg).
+        sim_time (float): Horizon the rider has to stay on the wall (seconds).
+        start_latitude (float or array_like): Starting latitude(s) in degrees;
+                                              several are solved together.
+        entry_speed (float): Initial horizontal speed (m/s).
+        tolerance (float): Width of the final bracket (N).
+        candidates (int): Forces evaluated per latitude and round.
+        max_force (float): Largest force tried (default: m g * MAX_GROWTH).
+        cache: Optional mapping remembering evaluations between calls.
+
+    Returns:
+        SolveResult: value holds the forces (N).
+    """
+    return _solve(model, mass, sim_time, start_latitude, entry_speed, "drive_force", mass * model.g, tolerance,
+                  candidates, max_force, cache)
+
+
+def minimum_entry_speed(model, mass, sim_time, start_latitude=0.0, drive_force=0.0, tolerance=1e-3,
+                        candidates=DEFAULT_CANDIDATES, max_speed=None, cache=None):
+    """
+    Smallest entry speed that keeps the rider on the wall.
+
+    Args:
+        model ... sim_time, start_latitude, candidates, cache: As for minimum_drive_force.
+        drive_force (float): Drive force magnitude (N).
+        tolerance (float): Width of the final bracket (m/s).
+        max_speed (float): Largest speed tried (default: sqrt(g R) * MAX_GROWTH).
+
+    Returns:
+        SolveResult: value holds the speeds (m/s).
+    """
+    return _solve(model, mass, sim_time, start_latitude, drive_force, "speed", np.sqrt(model.g * model.radius),
+                  tolerance, candidates, max_speed, cache)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m solver",
+                                     description="Smallest drive force or entry speed that avoids detachment.")
+    parser.add_argument("--radius", type=float, required=True)
+    parser.add_argument("--mass", type=float, default=100.0)
+    parser.add_argument("--sim-time", type=float, required=True, help="horizon to stay on the wall (s)")
+    parser.add_argument("--latitude", type=float, nargs="+", default=[0.0], help="starting latitude(s), degrees")
+    parser.add_argument("--solve", choices=("drive_force", "speed"), default="drive_force")
+    parser.add_argument("--speed", type=float, default=0.0, help="entry speed when solving for the force (m/s)")
+    parser.add_argument("--drive-force", type=float, default=0.0, help="drive force when solving for the speed (N)")
+    parser.add_argument("--tolerance", type=float, help="final bracket width (default: 0.5 N or 0.001 m/s)")
+    args = parser.parse_args(argv)
+
+    model = PhysicsModel(args.radius)
+    if args.solve == "speed":
+        result = minimum_entry_speed(model, args.mass, args.sim_time, args.latitude, args.drive_force,
+                                     args.tolerance or 1e-3)
+        unit = "m/s"
+    else:
+        result = minimum_drive_force(model, args.mass, args.sim_time, args.latitude, args.speed,
+                                     args.tolerance or 0.5)
+        unit = "N"
+    for latitude, value, lower, monotonic in zip(result.latitudes, result.value, result.lower, result.monotonic):
+        if not monotonic:
+            text = f"not monotonic (detaches at {lower:.6g} {unit} above a value that stays)"
+        elif np.isnan(value):
+            text = "not found"
+        else:
+            text = f"{value:.6g} {unit} (detaches at {lower:.6g})"
+        print(f"latitude {latitude:g}: {text}")
+    print(f"{result.evaluations} evaluations in {result.rounds} rounds", file=sys.stderr)
+    return 1 if np.any(np.isnan(result.value)) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# --- END OF FILE solver.py ---
@@ -0,0 +1,242 @@
+# --- START OF FILE storage.py ---
+
+"""
+On-disk trajectory storage for very long runs.
+
+A trajectory is a directory (conventionally named *.traj) with one .npy
+file per TrajectoryResult array plus meta.json:
+
+    positions.npy  velocities.npy  time.npy  contact.npy
+    event_indices.npy  events.npy  meta.json
+
+TrajectoryWriter appends chunks to these files as they are computed and
+rewrites the .npy headers after every chunk, so memory use does not grow
+with sim_time and a run that is still being written (or was interrupted)
+can already be opened. open_trajectory() memory-maps the arrays: samples
+are only read from disk when they are accessed.
+
+meta.json also holds the checkpoint of the last chunk written (see
+trajectory.Checkpoint); PhysicsModel.extend() continues from it, appending
+to the same files, to lengthen a finished run or resume an interrupted one.
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+from trajectory import TrajectoryResult, Checkpoint, EVENT_DTYPE
+
+FORMAT_VERSION = 1
+HEADER_SIZE = 256 # Bytes; fixed so the header can be rewritten in place as the file grows
+
+
+def _npy_header(dtype, shape):
+    """.npy version 1.0 header padded to HEADER_SIZE bytes."""
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': shape})
+    if len(header) > HEADER_SIZE - 11:
+        raise ValueError(f"dtype {dtype} does not fit a {HEADER_SIZE}-byte .npy header")
+    header = header.ljust(HEADER_SIZE - 11) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+class NpyAppender:
+    """
+    A .npy file that grows along its first axis.
+
+    With append=True an existing file written by NpyAppender is continued;
+    its dtype then takes precedence over `dtype`.
+    """
+    def __init__(self, path, dtype, row_shape=(), append=False):
+        self.path = path
+        self.row_shape = tuple(row_shape)
+        if append and os.path.exists(path):
+            with open(path, 'rb') as f:
+                np.lib.format.read_magic(f)
+                shape, _, file_dtype = np.lib.format.read_array_header_1_0(f)
+                if f.tell() != HEADER_SIZE or shape[1:] != self.row_shape:
+                    raise ValueError(f"{path} was not written by NpyAppender")
+            self.dtype = file_dtype
+            self.file = open(path, 'r+b')
+            self.truncate(shape[0]) # Drops a partly written last row
+        else:
+            self.dtype = np.dtype(dtype)
+            self.length = 0
+            self.file = open(path, 'wb')
+            self.file.write(_npy_header(self.dtype, (0,) + self.row_shape))
+
+    def truncate(self, length):
+        """Discards the rows from `length` on."""
+        self.length = length
+        self.file.truncate(HEADER_SIZE + length * self.dtype.itemsize * int(np.prod(self.row_shape)))
+        self.file.seek(0, os.SEEK_END)
+        self.flush()
+
+    def append(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        if rows.shape[1:] != self.row_shape:
+            raise ValueError(f"Expected rows of shape {self.row_shape}, got {rows.shape[1:]}")
+        self.file.write(rows.tobytes())
+        self.length += len(rows)
+
+    def flush(self):
+        """Makes the data written so far readable: data first, then the header that covers it."""
+        self.file.flush()
+        position = self.file.tell()
+        self.file.seek(0)
+        self.file.write(_npy_header(self.dtype, (self.length,) + self.row_shape))
+        self.file.seek(position)
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class TrajectoryWriter:
+    """
+    Writes TrajectoryResult chunks (e.g. from PhysicsModel.iter_trajectory)
+    incrementally into a trajectory directory.
+
+    Use as a context manager, or call close() when done; a run left by an
+    exception stays marked as incomplete.
+
+    With append=True the chunks are appended to an existing trajectory
+    directory. Samples after its last checkpoint (left by an interrupted
+    write) are discarded first, so the directory ends exactly where the
+    checkpoint continues.
+    """
+    def __init__(self, path, radius=None, mass=None, dtype=np.float64, append=False):
+        self.path = path
+        self.radius = radius
+        self.mass = mass
+        self.checkpoint = None
+        if append:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            if meta.get('format') != FORMAT_VERSION:
+                raise ValueError(f"Unsupported trajectory format: {meta.get('format')}")
+            self.radius = meta['radius'] if radius is None else radius
+            self.mass = meta['mass'] if mass is None else mass
+            if meta.get('checkpoint'):
+                self.checkpoint = Checkpoint.from_dict(meta['checkpoint'])
+        else:
+            os.makedirs(path, exist_ok=True)
+        self.arrays = {
+            'positions': NpyAppender(os.path.join(path, 'positions.npy'), dtype, (3,), append),
+            'velocities': NpyAppender(os.path.join(path, 'velocities.npy'), dtype, (3,), append),
+            'time': NpyAppender(os.path.join(path, 'time.npy'), np.float64, (), append),
+            'contact': NpyAppender(os.path.join(path, 'contact.npy'), bool, (), append),
+            'event_indices': NpyAppender(os.path.join(path, 'event_indices.npy'), np.intp, (), append),
+            'events': NpyAppender(os.path.join(path, 'events.npy'), EVENT_DTYPE, (), append),
+        }
+        self.length = 0
+        if append:
+            self._truncate_to_checkpoint()
+        self._write_meta(complete=False)
+
+    def _truncate_to_checkpoint(self):
+        n = min(self.arrays[name].length for name in ('positions', 'velocities', 'time', 'contact'))
+        if self.checkpoint is not None:
+            n = min(n, self.checkpoint.step + 1)
+        # Both event arrays are sorted, so the records to keep are a prefix
+        end_time = float(_load(self.arrays['time'].path, 'r')[n - 1]) if n else -np.inf
+        n_indices = int(np.searchsorted(_load(self.arrays['event_indices'].path, 'r'), n))
+        n_events = int(np.searchsorted(_load(self.arrays['events'].path, 'r')['time'], end_time, side='right'))
+        for name, length in (('positions', n), ('velocities', n), ('time', n), ('contact', n),
+                             ('event_indices', n_indices), ('events', n_events)):
+            self.arrays[name].truncate(length)
+        self.length = n
+
+    def append(self, chunk):
+        """Appends a chunk; its event indices are local to the chunk as yielded by iter_trajectory."""
+        if self.radius is None:
+            self.radius = chunk.radius
+        if self.mass is None:
+            self.mass = chunk.mass
+        for name in ('positions', 'velocities', 'time', 'contact', 'events'):
+            self.arrays[name].append(getattr(chunk, name))
+        self.arrays['event_indices'].append(chunk.event_indices + self.length)
+        self.length += len(chunk)
+        for array in self.arrays.values():
+            array.flush()
+        if chunk.checkpoint is not None:
+            self.checkpoint = chunk.checkpoint
+            self._write_meta(complete=False) # After the data it refers to
+
+    def close(self, complete=True):
+        for array in self.arrays.values():
+            array.close()
+        self._write_meta(complete)
+
+    def _write_meta(self, complete):
+        meta = dict(format=FORMAT_VERSION, radius=self.radius, mass=self.mass, complete=complete,
+                    checkpoint=None if self.checkpoint is None else self.checkpoint.to_dict())
+        path = os.path.join(self.path, 'meta.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path) # Never leaves a half-written meta.json behind
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self.close(complete=exc_type is None)
+
+
+def write_trajectory(chunks, path, radius=None, mass=None, dtype=np.float64):
+    """
+    Streams chunks into a trajectory directory.
+
+    Returns:
+        int: Number of samples written.
+    """
+    with TrajectoryWriter(path, radius, mass, dtype) as writer:
+        for chunk in chunks:
+            writer.append(chunk)
+    return writer.length
+
+
+def _load(path, mmap_mode):
+    # Empty arrays cannot be memory-mapped
+    return np.load(path, mmap_mode=None if os.path.getsize(path) <= HEADER_SIZE else mmap_mode)
+
+
+def open_trajectory(path, mmap_mode='r'):
+    """
+    Opens a trajectory directory with memory-mapped arrays.
+
+    A run that is still being written is truncated to the samples that
+    all arrays already cover and its last checkpoint.
+
+    Args:
+        path (str): Directory written by TrajectoryWriter.
+        mmap_mode (str): np.load memory-map mode; None reads everything into RAM.
+
+    Returns:
+        TrajectoryResult: Backed by the files; nothing is read until accessed.
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported trajectory format: {meta.get('format')}")
+    arrays = {name: _load(os.path.join(path, f'{name}.npy'), mmap_mode)
+              for name in ('positions', 'velocities', 'time', 'contact', 'event_indices', 'events')}
+    n = min(len(arrays[name]) for name in ('positions', 'velocities', 'time', 'contact'))
+    checkpoint = Checkpoint.from_dict(meta['checkpoint']) if meta.get('checkpoint') else None
+    if checkpoint is not None:
+        if n > checkpoint.step:
+            n = checkpoint.step + 1
+        else:
+            checkpoint = None # Files end before the checkpoint; it does not apply to them
+    event_indices = arrays['event_indices']
+    events = arrays['events']
+    if not meta['complete']:
+        event_indices = event_indices[event_indices < n]
+        events = events[events['time'] <= arrays['time'][n - 1]] if n else events[:0]
+    return TrajectoryResult(arrays['positions'][:n], arrays['velocities'][:n], arrays['time'][:n],
+                            arrays['contact'][:n], event_indices, meta['radius'], meta['mass'], events,
+                            checkpoint)
+
+# --- END OF FILE storage.py ---
@@ -0,0 +1,158 @@
+# --- START OF FILE surface.py ---
+
+"""
+Wall riding in the sphere's own surface coordinates.
+
+On the wall the rider has two degrees of freedom. In spherical
+coordinates about a polar axis (polar angle theta, azimuth phi) the
+motion follows
+
+    H = m R^2 / 2 * (theta_dot^2 + sin(theta)^2 * phi_dot^2) + V(theta, phi)
+
+plus the (non-conservative) drive force. The state used here is
+(theta, phi, theta_dot, L) with L = sin(theta)^2 * phi_dot, the conjugate
+momentum of phi divided by m R^2. H splits into three parts whose flows
+are exact:
+
+    kick     forces only: theta_dot and L change, theta and phi are fixed
+    drift_phi  sin(theta)^2 phi_dot^2 term: theta is fixed, phi and theta_dot change
+    drift_theta  theta_dot^2 term: only theta changes
+
+step() composes them symmetrically (kick/2, drift_phi/2, drift_theta,
+drift_phi/2, kick/2). The result is an explicit second-order symplectic
+method: the rider stays on the sphere by construction, so nothing has to
+be projected back, and the energy error stays bounded instead of drifting.
+
+Azimuth coordinates are singular at their poles, so two charts are used:
+polar axis Y (chart 0) away from the top and bottom of the sphere and
+polar axis X (chart 1) near them. chart_for() picks one from the current
+position alone; in the chart it picks sin(theta) >= sqrt(1/2).
+
+States are exchanged with the rest of the model as Cartesian (x, y, z)
+tuples in Animation coords (Y-up, gravity along -Y).
+"""
+
+import math
+
+CHART_SWITCH = math.sqrt(0.5) # |n_y| above which the X-axis chart is used
+
+
+def _to_local(chart, v):
+    """Cartesian vector in the chart's (a, b, polar axis) frame."""
+    x, y, z = v
+    return (x, z, y) if chart == 0 else (y, z, x)
+
+
+def _to_global(chart, v):
+    a, b, c = v
+    return (a, c, b) if chart == 0 else (c, a, b)
+
+
+def chart_for(pos, radius):
+    """Chart in which the position is at least 45 degrees from the poles."""
+    return 1 if abs(pos[1]) > CHART_SWITCH * radius else 0
+
+
+def to_chart(chart, pos, vel, radius):
+    """
+    Surface coordinates of a Cartesian state on the wall.
+
+    The position is taken by its direction only; the radial component of
+    the velocity is dropped.
+
+    Returns:
+        tuple: (theta, phi, theta_dot, L).
+    """
+    a, b, c = _to_local(chart, pos)
+    va, vb, vc = _to_local(chart, vel)
+    rho = math.hypot(a, b)
+    r = math.hypot(rho, c)
+    sin_theta, cos_theta = rho / r, c / r
+    cos_phi, sin_phi = a / rho, b / rho
+    v_theta = (va * cos_phi + vb * sin_phi) * cos_theta - vc * sin_theta
+    v_phi = vb * cos_phi - va * sin_phi
+    return math.atan2(rho, c), math.atan2(b, a), v_theta / radius, sin_theta * v_phi / radius
+
+
+def from_chart(chart, state, radius):
+    """Cartesian (pos, vel) of surface coordinates (theta, phi, theta_dot, L)."""
+    theta, phi, theta_dot, L = state
+    sin_theta, cos_theta = math.sin(theta), math.cos(theta)
+    sin_phi, cos_phi = math.sin(phi), math.cos(phi)
+    v_theta = radius * theta_dot
+    v_phi = radius * L / sin_theta
+    pos = (radius * sin_theta * cos_phi, radius * sin_theta * sin_phi, radius * cos_theta)
+    vel = (v_theta * cos_theta * cos_phi - v_phi * sin_phi,
+           v_theta * cos_theta * sin_phi + v_phi * cos_phi,
+           -v_theta * sin_theta)
+    return _to_global(chart, pos), _to_global(chart, vel)
+
+
+def _kick(chart, sin_theta, cos_theta, sin_phi, cos_phi, theta_dot, L, h, radius, g, drive):
+    """Exact flow of the forces over h at a fixed position."""
+    e_theta = _to_global(chart, (cos_theta * cos_phi, cos_theta * sin_phi, -sin_theta))
+    e_phi = _to_global(chart, (-sin_phi, cos_phi, 0.0))
+    ax, ay, az = 0.0, -g, 0.0
+    if drive > 0:
+        # Along the horizontal tangent, the same rule as PhysicsModel._drive_force
+        nx, _, nz = _to_global(chart, (sin_theta * cos_phi, sin_theta * sin_phi, cos_theta))
+        tangent_norm = math.hypot(nx, nz)
+        if tangent_norm > 1e-6:
+            ax, az = -drive * nz / tangent_norm, drive * nx / tangent_norm
+        else:
+            ax = drive
+    a_theta = ax * e_theta[0] + ay * e_theta[1] + az * e_theta[2]
+    a_phi = ax * e_phi[0] + ay * e_phi[1] + az * e_phi[2]
+    return theta_dot + a_theta / radius * h, L + sin_theta * a_phi / radius * h
+
+
+def step(chart, state, h, radius, g, drive=0.0):
+    """
+    Advances surface coordinates by h with the symmetric splitting.
+
+    Args:
+        chart (int): Chart of the coordinates.
+        state (tuple): (theta, phi, theta_dot, L).
+        h (float): Step (s).
+        radius (float): Sphere radius (m).
+        g (float): Gravitational acceleration (m/s^2), along -Y.
+        drive (float): Drive acceleration (drive force / mass, m/s^2).
+
+    Returns:
+        tuple: The new (theta, phi, theta_dot, L).
+    """
+    theta, phi, theta_dot, L = state
+    half = 0.5 * h
+    sin_theta, cos_theta = math.sin(theta), math.cos(theta)
+    sin_phi, cos_phi = math.sin(phi), math.cos(phi)
+    theta_dot, L = _kick(chart, sin_theta, cos_theta, sin_phi, cos_phi, theta_dot, L, half, radius, g, drive)
+
+    phi_dot = L / (sin_theta * sin_theta)
+    phi += phi_dot * half
+    theta_dot += phi_dot * phi_dot * sin_theta * cos_theta * half
+
+    theta += theta_dot * h
+    sin_theta, cos_theta = math.sin(theta), math.cos(theta)
+
+    phi_dot = L / (sin_theta * sin_theta)
+    phi += phi_dot * half
+    theta_dot += phi_dot * phi_dot * sin_theta * cos_theta * half
+
+    sin_phi, cos_phi = math.sin(phi), math.cos(phi)
+    theta_dot, L = _kick(chart, sin_theta, cos_theta, sin_phi, cos_phi, theta_dot, L, half, radius, g, drive)
+    return theta, phi, theta_dot, L
+
+
+def advance(pos, vel, h, radius, g, drive=0.0):
+    """Cartesian wall state after riding for h (one step in the chart suited to pos)."""
+    chart = chart_for(pos, radius)
+    return from_chart(chart, step(chart, to_chart(chart, pos, vel, radius), h, radius, g, drive), radius)
+
+
+def ballistic(pos, vel, t, g):
+    """Exact free flight under gravity (along -Y) for time t."""
+    x, y, z = pos
+    vx, vy, vz = vel
+    return (x + vx * t, y + (vy - 0.5 * g * t) * t, z + vz * t), (vx, vy - g * t, vz)
+
+# --- END OF FILE surface.py ---
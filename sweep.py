@@ -0,0 +1,175 @@
+# --- START OF FILE sweep.py ---
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from cache import TrajectoryCache
+from model import PhysicsModel
+from trajectory import OUTCOME_STAYS, OUTCOME_DETACHES, OUTCOME_FALLS, OUTCOME_INVALID, OUTCOME_NAMES
+
+
+def grid_points(radii, drive_forces, entry_speeds):
+    """Full factorial grid as an (n, 3) array of (radius, drive_force, entry_speed)."""
+    grid = np.meshgrid(np.asarray(radii, dtype=float),
+                       np.asarray(drive_forces, dtype=float),
+                       np.asarray(entry_speeds, dtype=float), indexing='ij')
+    return np.stack([axis.ravel() for axis in grid], axis=1)
+
+
+def latin_hypercube_points(n_samples, radius_range, drive_force_range, entry_speed_range, seed=None):
+    """
+    Latin-hypercube sample of the (radius, drive_force, entry_speed) box.
+
+    Every range is split into n_samples strata and each stratum is hit
+    exactly once per dimension.
+    """
+    rng = np.random.default_rng(seed)
+    points = np.empty((n_samples, 3))
+    for dim, (low, high) in enumerate((radius_range, drive_force_range, entry_speed_range)):
+        strata = (rng.permutation(n_samples) + rng.random(n_samples)) / n_samples
+        points[:, dim] = low + strata * (high - low)
+    return points
+
+
+def evaluate_point(radius, drive_force, entry_speed, sim_time, mass, start_latitude=0.0,
+                   integrator="adaptive", drop_tolerance=0.05, cache=None):
+    """
+    Simulates one rider and classifies the outcome.
+
+    The rider starts on the wall at start_latitude (degrees, 0 = equator)
+    moving horizontally with entry_speed in the direction of the drive force.
+    With a TrajectoryCache, points simulated before are looked up.
+
+    Returns:
+        tuple: (outcome, detach_time, min_height)
+               detach_time is NaN unless the rider detaches, min_height is the
+               lowest point reached as a fraction of the radius (NaN for
+               OUTCOME_INVALID, when the model rejects the parameters).
+    """
+    latitude = np.radians(start_latitude)
+    initial_pos = (radius * np.cos(latitude), radius * np.sin(latitude), 0.0)
+    initial_vel = (0.0, 0.0, entry_speed)
+    result = PhysicsModel(radius, cache=cache).calculate_trajectory(
+        initial_pos, initial_vel, drive_force, sim_time, mass, integrator=integrator
+    )
+    if len(result) == 0:
+        return OUTCOME_INVALID, np.nan, np.nan
+
+    min_height = float(result.positions[:, 1].min()) / radius
+    lost = np.flatnonzero(~result.contact)
+    if len(lost):
+        return OUTCOME_DETACHES, float(result.time[lost[0]]), min_height
+    if min_height < np.sin(latitude) - drop_tolerance:
+        return OUTCOME_FALLS, np.nan, min_height
+    return OUTCOME_STAYS, np.nan, min_height
+
+
+class SweepResult:
+    """
+    Stability map of a sweep: one outcome code, detachment time and lowest
+    height per (radius, drive_force, entry_speed) point.
+    """
+    __slots__ = ('points', 'outcome', 'detach_time', 'min_height', 'shape')
+
+    def __init__(self, points, outcome, detach_time, min_height, shape=None):
+        self.points = points
+        self.outcome = outcome
+        self.detach_time = detach_time
+        self.min_height = min_height
+        self.shape = shape
+
+    def __len__(self):
+        return len(self.points)
+
+    def as_grid(self, values=None):
+        """Reshapes a per-point array (outcome by default) to the sweep grid."""
+        if self.shape is None:
+            raise ValueError("Sweep was not run on a grid")
+        return (self.outcome if values is None else values).reshape(self.shape)
+
+    def summary(self):
+        """Number of points per outcome, keyed by outcome name."""
+        return {name: int(np.count_nonzero(self.outcome == code)) for code, name in OUTCOME_NAMES.items()}
+
+
+def _evaluate_chunk(buffer_names, n_points, start, points, sim_time, mass, start_latitude, integrator, drop_tolerance,
+                    cache_dir):
+    """Worker: evaluates points[start:start+len(points)] into the shared result buffers."""
+    cache = TrajectoryCache(cache_dir) if cache_dir else None
+    buffers = [shared_memory.SharedMemory(name=name) for name in buffer_names]
+    try:
+        outcome = np.ndarray((n_points,), dtype=np.int8, buffer=buffers[0].buf)
+        detach_time = np.ndarray((n_points,), dtype=np.float64, buffer=buffers[1].buf)
+        min_height = np.ndarray((n_points,), dtype=np.float64, buffer=buffers[2].buf)
+        for offset, (radius, drive_force, entry_speed) in enumerate(points):
+            i = start + offset
+            outcome[i], detach_time[i], min_height[i] = evaluate_point(
+                radius, drive_force, entry_speed, sim_time, mass, start_latitude, integrator, drop_tolerance, cache
+            )
+        del outcome, detach_time, min_height
+    finally:
+        for buffer in buffers:
+            buffer.close()
+
+
+def stability_map(points, sim_time, mass=100.0, start_latitude=0.0, integrator="adaptive",
+                  drop_tolerance=0.05, workers=None, chunk_size=None, shape=None, cache_dir=None):
+    """
+    Evaluates every (radius, drive_force, entry_speed) point in a process pool.
+
+    Workers write straight into shared-memory result buffers, so only the
+    point coordinates travel between processes.
+
+    Args:
+        points (array_like): (n, 3) points, e.g. from grid_points or latin_hypercube_points.
+        sim_time (float): Simulated horizon per point (seconds).
+        mass (float): Mass of the rider (kg).
+        start_latitude (float): Starting latitude in degrees (0 = equator).
+        integrator (str): Integrator passed to calculate_trajectory.
+        drop_tolerance (float): Allowed drop below the starting height, as a fraction of R.
+        workers (int): Number of processes (default: all cores, 1 runs in-process).
+        chunk_size (int): Points per task (default: about four tasks per worker).
+        shape (tuple): Grid shape stored on the result for as_grid().
+        cache_dir (str): Trajectory cache directory shared by the workers
+                         (None disables caching).
+
+    Returns:
+        SweepResult
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    n_points = len(points)
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, -(-n_points // (4 * workers)))
+    itemsizes = (np.dtype(np.int8).itemsize, np.dtype(np.float64).itemsize, np.dtype(np.float64).itemsize)
+    buffers = [shared_memory.SharedMemory(create=True, size=max(1, n_points * size)) for size in itemsizes]
+    try:
+        names = [buffer.name for buffer in buffers]
+        args = (sim_time, mass, start_latitude, integrator, drop_tolerance, cache_dir)
+        starts = range(0, n_points, chunk_size)
+        if workers == 1:
+            for start in starts:
+                _evaluate_chunk(names, n_points, start, points[start:start + chunk_size], *args)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_evaluate_chunk, names, n_points, start, points[start:start + chunk_size], *args)
+                           for start in starts]
+                for future in futures:
+                    future.result()
+        outcome = np.ndarray((n_points,), dtype=np.int8, buffer=buffers[0].buf).copy()
+        detach_time = np.ndarray((n_points,), dtype=np.float64, buffer=buffers[1].buf).copy()
+        min_height = np.ndarray((n_points,), dtype=np.float64, buffer=buffers[2].buf).copy()
+    finally:
+        for buffer in buffers:
+            buffer.close()
+            buffer.unlink()
+    return SweepResult(points, outcome, detach_time, min_height, shape)
+
+
+def stability_grid(radii, drive_forces, entry_speeds, sim_time, **kwargs):
+    """Grid sweep; the result reshapes to (len(radii), len(drive_forces), len(entry_speeds))."""
+    shape = (len(radii), len(drive_forces), len(entry_speeds))
+    return stability_map(grid_points(radii, drive_forces, entry_speeds), sim_time, shape=shape, **kwargs)
+
+# --- END OF FILE sweep.py ---
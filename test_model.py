@@ -0,0 +1,53 @@
+# --- START OF FILE test_model.py ---
+
+"""
+Checks of the event log of the Euler loops (python -m pytest test_model.py).
+"""
+
+import numpy as np
+import pytest
+from model import PhysicsModel
+from trajectory import EVENT_CONTACT
+
+RADIUS = 4.0
+MASS = 100.0
+# Pressed to the equator (v^2/R well above g) for the whole run
+STEADY_RIDE = ((RADIUS, 0.0, 0.0), (0.0, 0.0, 7.0), 0.0)
+# Starts inside the sphere and lands on the wall
+LANDING = ((0.1, -3.0, 0.0), (0.0, 0.0, 2.0), 15.0)
+# Too slow near the top: leaves and touches the wall again and again
+BOUNCING = ((0.0, 3.9, 0.0), (0.0, 0.0, 1.0), 0.0)
+
+
+@pytest.fixture(params=["numpy", "scalar"])
+def run(request):
+    model = PhysicsModel(RADIUS)
+    def run(start, sim_time=10.0):
+        pos, vel, drive = start
+        return model, model.calculate_trajectory(pos, vel, drive, sim_time, MASS, backend=request.param)
+    return run
+
+
+def test_steady_wall_ride_logs_no_events(run):
+    # The centrifugal check releases the rider and the landing branch catches it again every step
+    _, result = run(STEADY_RIDE, 20.0)
+    assert result.contact.all()
+    assert len(result.events) == 0
+
+
+@pytest.mark.parametrize("start", [LANDING, BOUNCING], ids=["landing", "bouncing"])
+def test_one_event_per_contact_change(run, start):
+    _, result = run(start)
+    assert len(result.events) > 0
+    np.testing.assert_array_equal(result.events['step'], result.event_indices)
+    np.testing.assert_array_equal(result.events['type'] == EVENT_CONTACT, result.contact[result.event_indices])
+
+
+@pytest.mark.parametrize("start", [LANDING, BOUNCING], ids=["landing", "bouncing"])
+def test_event_normal_force_matches_model(run, start):
+    model, result = run(start)
+    steps = result.events['step']
+    expected = model.normal_force(result.positions[steps], result.velocities[steps], MASS)
+    np.testing.assert_allclose(result.events['normal_force'], expected, rtol=1e-9)
+
+# --- END OF FILE test_model.py ---
@@ -0,0 +1,436 @@
+# --- START OF FILE trajectory.py ---
+
+import json
+
+import numpy as np
+
+# Event record types
+EVENT_CONTACT = 1            # Contact with the wall established
+EVENT_DETACHMENT = 2         # Rider left the wall
+EVENT_CENTRIFUGAL = 3        # Centrifugal check of the Euler loop released the rider
+EVENT_IMPACT = 4             # Bounce off the wall without settling (adaptive integrator)
+EVENT_NAMES = {EVENT_CONTACT: "contact", EVENT_DETACHMENT: "detachment",
+               EVENT_CENTRIFUGAL: "centrifugal", EVENT_IMPACT: "impact"}
+
+# One record per event: sample time and index, type, speed and the normal
+# force m * (|v|^2 / R - g * n_y) at that moment (as PhysicsModel.normal_force;
+# negative when the wall cannot hold the rider)
+EVENT_DTYPE = np.dtype([('time', np.float64), ('step', np.int64), ('type', np.int8),
+                        ('speed', np.float64), ('normal_force', np.float64)])
+
+# One record per encounter of two riders in multi-rider runs: the riders,
+# first and last sample time within the proximity distance, the closest
+# distance and when it occurred, and whether that counts as a collision
+ENCOUNTER_DTYPE = np.dtype([('rider_a', np.int32), ('rider_b', np.int32), ('start', np.float64),
+                            ('end', np.float64), ('min_distance', np.float64), ('min_time', np.float64),
+                            ('collision', np.bool_)])
+
+# Outcome of a whole run (e.g. a sweep point, see sweep.evaluate_point)
+OUTCOME_STAYS = 0     # Rider stays on the wall for the whole horizon
+OUTCOME_DETACHES = 1  # Rider leaves the wall at detach_time
+OUTCOME_FALLS = 2     # Rider stays on the wall but slides below the starting latitude
+OUTCOME_INVALID = 3   # Parameters rejected by the model, nothing was simulated
+OUTCOME_NAMES = {OUTCOME_STAYS: "stays on wall", OUTCOME_DETACHES: "detaches", OUTCOME_FALLS: "falls",
+                 OUTCOME_INVALID: "invalid"}
+
+G = 9.81 # Gravitational acceleration (m/s^2) of PhysicsModel, for derived channels
+
+# Quantities derived from each sample (see derived_channels). Energies in J,
+# forces in N (per kg if the mass is unknown), speeds in m/s, angles in rad.
+CHANNEL_DTYPE = np.dtype([('speed', np.float64), ('kinetic_energy', np.float64), ('potential_energy', np.float64),
+                          ('total_energy', np.float64), ('normal_force', np.float64), ('g_load', np.float64),
+                          ('critical_margin', np.float64), ('latitude', np.float64), ('longitude', np.float64)])
+
+
+def derived_channels(positions, velocities, contact, radius, mass=None, g=G):
+    """
+    Derived quantities of every sample in one vectorized pass.
+
+    normal_force is the force the wall exerts towards the centre,
+    m * (|v|^2 / R - g * n_y) as PhysicsModel.normal_force, while in contact
+    and 0 in flight; g_load is the same in units of m * g. critical_margin
+    is the speed minus the critical speed sqrt(g * R). Potential energy is
+    measured from the bottom of the sphere. latitude is the angle above the
+    equator, longitude the angle about the vertical (Y) axis from +X.
+
+    Args:
+        positions, velocities: (n, 3) arrays in Animation coords (Y-up).
+        contact: (n,) wall contact flags.
+        radius (float): Sphere radius (m).
+        mass (float): Rider mass (kg); None gives energies and forces per kg.
+        g (float): Gravitational acceleration (m/s^2).
+
+    Returns:
+        np.ndarray: (n,) records of CHANNEL_DTYPE.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    velocities = np.asarray(velocities, dtype=np.float64)
+    mass = 1.0 if mass is None else mass
+    channels = np.empty(len(positions), dtype=CHANNEL_DTYPE)
+    speed_sq = np.einsum('ij,ij->i', velocities, velocities)
+    dist = np.sqrt(np.einsum('ij,ij->i', positions, positions))
+    y = positions[:, 1]
+    n_y = np.divide(y, dist, out=np.zeros_like(y), where=dist > 0)
+    channels['speed'] = np.sqrt(speed_sq)
+    channels['kinetic_energy'] = 0.5 * mass * speed_sq
+    channels['potential_energy'] = mass * g * (y + radius)
+    channels['total_energy'] = channels['kinetic_energy'] + channels['potential_energy']
+    channels['normal_force'] = np.where(contact, mass * (speed_sq / radius - g * n_y), 0.0)
+    channels['g_load'] = channels['normal_force'] / (mass * g)
+    channels['critical_margin'] = channels['speed'] - np.sqrt(g * radius)
+    channels['latitude'] = np.arcsin(np.clip(n_y, -1.0, 1.0))
+    channels['longitude'] = np.arctan2(positions[:, 2], positions[:, 0])
+    return channels
+
+
+class Checkpoint:
+    """
+    Integrator state at one sample of a run: everything needed to continue
+    the run from there (see PhysicsModel.resume).
+
+    `step` is the index of the sample in the whole run, `step_size` the next
+    step of the adaptive integrator (None for the Euler loop). `settings`
+    holds the model and run parameters the state belongs to. Positions and
+    velocities are kept in float64 regardless of the result dtype, so
+    continuing from a checkpoint is exact.
+    """
+    __slots__ = ('time', 'step', 'position', 'velocity', 'contact', 'step_size', 'settings')
+
+    def __init__(self, time, step, position, velocity, contact, step_size=None, settings=None):
+        self.time = float(time)
+        self.step = int(step)
+        self.position = np.array(position, dtype=np.float64)
+        self.velocity = np.array(velocity, dtype=np.float64)
+        self.contact = bool(contact)
+        self.step_size = None if step_size is None else float(step_size)
+        self.settings = dict(settings or {})
+
+    def __repr__(self):
+        return f"Checkpoint(t={self.time:.3f}s, step={self.step}, contact={self.contact})"
+
+    def to_dict(self):
+        """JSON-serializable form; floats survive the round trip exactly."""
+        return dict(time=self.time, step=self.step, position=self.position.tolist(),
+                    velocity=self.velocity.tolist(), contact=self.contact, step_size=self.step_size,
+                    settings=self.settings)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['time'], data['step'], data['position'], data['velocity'], data['contact'],
+                   data.get('step_size'), data.get('settings'))
+
+    def save(self, file):
+        """Writes the checkpoint as JSON to a path or text file object."""
+        if isinstance(file, (str, bytes)) or hasattr(file, '__fspath__'):
+            with open(file, 'w') as f:
+                json.dump(self.to_dict(), f)
+        else:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, file):
+        """Reads a checkpoint written by save()."""
+        if isinstance(file, (str, bytes)) or hasattr(file, '__fspath__'):
+            with open(file) as f:
+                return cls.from_dict(json.load(f))
+        return cls.from_dict(json.load(file))
+
+
+class TrajectoryResult:
+    """
+    Compact, array-backed result of a trajectory calculation.
+
+    Positions and velocities are stored as (n, 3) arrays, the sample times,
+    contact flags and the indices of contact/detachment transitions as 1-D
+    arrays. Slicing with a step slice returns views, no data is copied;
+    the step must be positive.
+    `events` is the structured event log (see EVENT_DTYPE). `checkpoint` is
+    the integrator state at the last sample when the result comes from a
+    model run, so the run can be extended later; None otherwise.
+    channels() holds derived quantities, computed once on first use.
+    """
+    __slots__ = ('positions', 'velocities', 'time', 'contact', 'event_indices', 'events', 'radius', 'mass',
+                 'checkpoint', '_channels')
+
+    def __init__(self, positions, velocities, time, contact, event_indices=None, radius=None, mass=None,
+                 events=None, checkpoint=None):
+        self.positions = positions
+        self.velocities = velocities
+        self.time = time
+        self.contact = contact
+        if event_indices is None:
+            event_indices = np.flatnonzero(contact[1:] != contact[:-1]) + 1
+        self.event_indices = event_indices
+        self.events = np.empty(0, dtype=EVENT_DTYPE) if events is None else events
+        self.radius = radius
+        self.mass = mass
+        self.checkpoint = checkpoint
+        self._channels = None
+
+    @classmethod
+    def allocate(cls, n, dtype=np.float64, radius=None, mass=None):
+        """Preallocates a result for n samples; the arrays are filled in place."""
+        return cls(np.empty((n, 3), dtype=dtype),
+                   np.empty((n, 3), dtype=dtype),
+                   np.empty(n, dtype=np.float64),
+                   np.zeros(n, dtype=bool),
+                   np.empty(0, dtype=np.intp),
+                   radius, mass)
+
+    @classmethod
+    def empty(cls, dtype=np.float64):
+        """Result returned for invalid parameters."""
+        return cls.allocate(0, dtype)
+
+    @classmethod
+    def concatenate(cls, chunks, dtype=np.float64):
+        """Joins consecutive chunks (e.g. from PhysicsModel.iter_trajectory) into one result."""
+        if not chunks:
+            return cls.empty(dtype)
+        if len(chunks) == 1:
+            return chunks[0]
+        offsets = np.cumsum([0] + [len(chunk) for chunk in chunks[:-1]])
+        result = cls(np.concatenate([chunk.positions for chunk in chunks]),
+                     np.concatenate([chunk.velocities for chunk in chunks]),
+                     np.concatenate([chunk.time for chunk in chunks]),
+                     np.concatenate([chunk.contact for chunk in chunks]),
+                     np.concatenate([chunk.event_indices + offset for chunk, offset in zip(chunks, offsets)]),
+                     chunks[0].radius, chunks[0].mass,
+                     np.concatenate([chunk.events for chunk in chunks]), chunks[-1].checkpoint)
+        if any(chunk._channels is not None for chunk in chunks):
+            # Channels already derived are kept; a growing result only derives the new samples
+            result._channels = np.concatenate([chunk.channels() for chunk in chunks])
+        return result
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError("TrajectoryResult supports slicing only; index .positions/.velocities for single samples")
+        start, stop, step = index.indices(len(self))
+        if step < 0:
+            # Transitions and events are ordered in time; reversed they would mean the opposite
+            raise ValueError("TrajectoryResult slices need a positive step; reverse the arrays instead")
+        indices = None # Transitions between the samples a stepped slice keeps are found from its flags
+        if step == 1:
+            indices = self.event_indices
+            indices = indices[(indices >= start) & (indices < stop)] - start
+        events = self.events
+        if len(events) and stop > start:
+            events = events[(events['time'] >= self.time[start]) & (events['time'] <= self.time[stop - 1])]
+        else:
+            events = events[:0]
+        # The checkpoint still applies if the slice ends with the last sample
+        ends_at_last = start < stop == len(self) and (stop - 1 - start) % step == 0
+        result = TrajectoryResult(self.positions[index], self.velocities[index], self.time[index],
+                                  self.contact[index], indices, self.radius, self.mass, events,
+                                  self.checkpoint if ends_at_last else None)
+        if self._channels is not None:
+            result._channels = self._channels[index]
+        return result
+
+    def __repr__(self):
+        return (f"TrajectoryResult(n={len(self)}, dtype={self.positions.dtype}, "
+                f"t_end={self.time[-1] if len(self) else 0.0:.3f}s, transitions={len(self.event_indices)}, "
+                f"events={len(self.events)})")
+
+    def save(self, file, compressed=True):
+        """Writes the result to an .npz file (compressed by default)."""
+        savez = np.savez_compressed if compressed else np.savez
+        extra = {} if self.checkpoint is None else dict(checkpoint=json.dumps(self.checkpoint.to_dict()))
+        savez(file, positions=self.positions, velocities=self.velocities, time=self.time,
+              contact=self.contact, event_indices=self.event_indices, events=self.events,
+              radius=np.nan if self.radius is None else self.radius,
+              mass=np.nan if self.mass is None else self.mass, **extra)
+
+    @classmethod
+    def load(cls, file):
+        """Reads a result written by save()."""
+        with np.load(file) as data:
+            radius = float(data['radius'])
+            mass = float(data['mass'])
+            return cls(data['positions'], data['velocities'], data['time'], data['contact'],
+                       data['event_indices'], None if np.isnan(radius) else radius,
+                       None if np.isnan(mass) else mass,
+                       data['events'] if 'events' in data else None,
+                       Checkpoint.from_dict(json.loads(str(data['checkpoint']))) if 'checkpoint' in data else None)
+
+    @property
+    def duration(self):
+        return float(self.time[-1] - self.time[0]) if len(self) else 0.0
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes
+                   for name in ('positions', 'velocities', 'time', 'contact', 'event_indices', 'events'))
+
+    def channels(self):
+        """
+        Derived quantities of every sample (see derived_channels), computed
+        on first use and kept with the result. Gravity is that of the run
+        when the result has a checkpoint, G otherwise.
+
+        Returns:
+            np.ndarray: (n,) records of CHANNEL_DTYPE.
+        """
+        if self._channels is None:
+            if self.radius is None:
+                raise ValueError("Derived channels need the sphere radius")
+            g = self.checkpoint.settings.get('g', G) if self.checkpoint is not None else G
+            self._channels = derived_channels(self.positions, self.velocities, self.contact, self.radius,
+                                              self.mass, g)
+        return self._channels
+
+    def event_log(self):
+        """Events as a list of dicts with readable type names."""
+        return [{'time': float(e['time']), 'step': int(e['step']), 'type': EVENT_NAMES.get(int(e['type']), "unknown"),
+                 'speed': float(e['speed']), 'normal_force': float(e['normal_force'])} for e in self.events]
+
+
+
+class RidersResult:
+    """
+    Result of a multi-rider run (see PhysicsModel.calculate_riders).
+
+    Arrays are sample-major: positions and velocities are (n, N, 3),
+    contact is (n, N) and time (n,) for N riders. `encounters` is the
+    encounter log (see ENCOUNTER_DTYPE).
+    """
+    __slots__ = ('positions', 'velocities', 'time', 'contact', 'encounters', 'radius', 'masses')
+
+    def __init__(self, positions, velocities, time, contact, encounters=None, radius=None, masses=None):
+        self.positions = positions
+        self.velocities = velocities
+        self.time = time
+        self.contact = contact
+        self.encounters = np.empty(0, dtype=ENCOUNTER_DTYPE) if encounters is None else encounters
+        self.radius = radius
+        self.masses = masses
+
+    @classmethod
+    def allocate(cls, n, n_riders, radius=None, masses=None):
+        return cls(np.empty((n, n_riders, 3)), np.empty((n, n_riders, 3)), np.empty(n),
+                   np.zeros((n, n_riders), dtype=bool), None, radius, masses)
+
+    @classmethod
+    def concatenate(cls, chunks):
+        """Joins consecutive chunks (e.g. from PhysicsModel.iter_riders) into one result."""
+        if not chunks:
+            return cls.allocate(0, 0)
+        if len(chunks) == 1:
+            return chunks[0]
+        return cls(np.concatenate([chunk.positions for chunk in chunks]),
+                   np.concatenate([chunk.velocities for chunk in chunks]),
+                   np.concatenate([chunk.time for chunk in chunks]),
+                   np.concatenate([chunk.contact for chunk in chunks]),
+                   np.concatenate([chunk.encounters for chunk in chunks]),
+                   chunks[0].radius, chunks[0].masses)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __repr__(self):
+        return (f"RidersResult(n={len(self)}, riders={self.n_riders}, "
+                f"t_end={self.time[-1] if len(self) else 0.0:.3f}s, encounters={len(self.encounters)})")
+
+    @property
+    def n_riders(self):
+        return self.positions.shape[1]
+
+    def rider(self, k):
+        """Trajectory of rider k as a TrajectoryResult of views into this result."""
+        mass = None if self.masses is None else float(self.masses[k])
+        return TrajectoryResult(self.positions[:, k], self.velocities[:, k], self.time, self.contact[:, k],
+                                radius=self.radius, mass=mass)
+
+    def collisions(self):
+        """Encounters closer than the collision distance."""
+        return self.encounters[self.encounters['collision']]
+
+    def encounters_at(self, t):
+        """Encounters in progress at time t."""
+        return self.encounters[(self.encounters['start'] <= t) & (t <= self.encounters['end'])]
+
+
+class ResultBuffer:
+    """
+    Growing result of a streamed run: the chunks (TrajectoryResult or
+    RidersResult, all of one kind) are copied into arrays whose capacity
+    doubles when full, so appending a chunk costs its own length instead of
+    the whole result as with concatenate. result() returns views of the
+    filled part.
+
+    Derived channels of TrajectoryResult chunks are kept as well (computed
+    per chunk) while the buffer holds at most channel_limit samples.
+    """
+    __slots__ = ('capacity', 'channel_limit', '_n', '_arrays', '_channels', '_logs', '_first', '_last')
+
+    def __init__(self, capacity=0, channel_limit=0):
+        self.capacity = capacity
+        self.channel_limit = channel_limit
+        self._n = 0
+        self._arrays = None
+        self._channels = None
+        self._logs = None
+        self._first = self._last = None
+
+    def __len__(self):
+        return self._n
+
+    def append(self, chunk):
+        """Copies a chunk that continues the buffered samples to their end."""
+        names = ('positions', 'velocities', 'time', 'contact')
+        n, end = len(chunk), self._n + len(chunk)
+        if self._arrays is None:
+            self.capacity = max(self.capacity, n)
+            self._arrays = {name: np.empty((self.capacity,) + getattr(chunk, name).shape[1:],
+                                           getattr(chunk, name).dtype) for name in names}
+            self._first = chunk
+            if isinstance(chunk, TrajectoryResult):
+                self._logs = [chunk.event_indices[:0], chunk.events[:0]]
+                if chunk.radius is not None and self.channel_limit:
+                    self._channels = np.empty(self.capacity, dtype=CHANNEL_DTYPE)
+            else:
+                self._logs = [chunk.encounters[:0]]
+        elif end > self.capacity:
+            self.capacity = max(end, 2 * self.capacity)
+            for name, array in self._arrays.items():
+                self._arrays[name] = np.empty((self.capacity,) + array.shape[1:], array.dtype)
+                self._arrays[name][:self._n] = array[:self._n]
+            if self._channels is not None:
+                channels, self._channels = self._channels, np.empty(self.capacity, dtype=CHANNEL_DTYPE)
+                self._channels[:self._n] = channels[:self._n]
+        for name in names:
+            self._arrays[name][self._n:end] = getattr(chunk, name)
+        if self._channels is not None:
+            if end > self.channel_limit:
+                self._channels = None
+            else:
+                self._channels[self._n:end] = chunk.channels()
+        if isinstance(chunk, TrajectoryResult):
+            if len(chunk.event_indices):
+                self._logs[0] = np.concatenate([self._logs[0], chunk.event_indices + self._n])
+            if len(chunk.events):
+                self._logs[1] = np.concatenate([self._logs[1], chunk.events])
+        elif len(chunk.encounters):
+            self._logs[0] = np.concatenate([self._logs[0], chunk.encounters])
+        self._n = end
+        self._last = chunk
+
+    def result(self):
+        """The buffered samples as a result of views (no copy); None while empty of chunks."""
+        if self._arrays is None:
+            return None
+        n, arrays, first = self._n, self._arrays, self._first
+        if isinstance(first, RidersResult):
+            return RidersResult(arrays['positions'][:n], arrays['velocities'][:n], arrays['time'][:n],
+                                arrays['contact'][:n], self._logs[0], first.radius, first.masses)
+        result = TrajectoryResult(arrays['positions'][:n], arrays['velocities'][:n], arrays['time'][:n],
+                                  arrays['contact'][:n], self._logs[0], first.radius, first.mass, self._logs[1],
+                                  self._last.checkpoint)
+        if self._channels is not None:
+            result._channels = self._channels[:n]
+        return result
+
+# --- END OF FILE trajectory.py ---
@@ -0,0 +1,106 @@
+# --- START OF FILE worker.py ---
+
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from trajectory import TrajectoryResult, RidersResult
+
+class SimulationWorker(QThread):
+    """
+    Runs PhysicsModel.iter_trajectory off the GUI thread.
+
+    Chunks are emitted as soon as they are computed so the timeline can
+    grow while the simulation is still running. cancel() stops the run
+    at the next chunk boundary; partial results are kept.
+
+    With base (a result with a checkpoint) the run continues from the end
+    of base instead of starting over: only the new samples are emitted as
+    chunks, and completed carries base followed by them.
+    """
+    chunk_ready = pyqtSignal(object)   # TrajectoryResult chunk
+    progress = pyqtSignal(int)         # Percent of sim_time done
+    completed = pyqtSignal(object)     # Full TrajectoryResult
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, model, initial_pos, initial_vel, drive_force, sim_time, mass,
+                 chunk_size=2000, parent=None, base=None, **options):
+        super().__init__(parent)
+        self.model = model
+        self.base = base
+        self.args = (initial_pos, initial_vel, drive_force, sim_time, mass)
+        self.sim_time = sim_time
+        self.chunk_size = chunk_size
+        self.options = options
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def run(self):
+        cache = self.model.cache
+        try:
+            key = self.model.cache_key(*self.args, **self.options) if cache is not None else None
+            result = cache.get(key) if key is not None and self.base is None else None
+            if result is not None:
+                self.chunk_ready.emit(result)
+                self.progress.emit(100)
+                self.completed.emit(result)
+                return
+
+            if self.base is not None:
+                chunks = [self.base]
+                run = self.model.resume(self.base.checkpoint, self.sim_time, self.chunk_size)
+            else:
+                chunks = []
+                run = self.model.iter_trajectory(*self.args, chunk_size=self.chunk_size, **self.options)
+            for chunk in run:
+                if self.is_cancelled():
+                    break
+                chunks.append(chunk)
+                self.chunk_ready.emit(chunk)
+                self.progress.emit(int(100 * chunk.time[-1] / self.sim_time))
+            if self.is_cancelled():
+                self.cancelled.emit()
+                return
+
+            result = TrajectoryResult.concatenate(chunks)
+            # Extended Euler runs equal a single run, adaptive ones only within the tolerances
+            if key is not None and len(result) and (self.base is None or self.options.get('integrator') != "adaptive"):
+                cache.put(key, result)
+            self.completed.emit(result)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class RidersWorker(SimulationWorker):
+    """
+    Runs PhysicsModel.iter_riders off the GUI thread. Chunks and the
+    completed result are RidersResult; multi-rider runs are not cached.
+    """
+    def __init__(self, model, initial_positions, initial_velocities, drive_forces, masses, sim_time,
+                 chunk_size=500, parent=None, **options):
+        super().__init__(model, initial_positions, initial_velocities, drive_forces, sim_time, masses,
+                         chunk_size, parent, **options)
+        self.args = (initial_positions, initial_velocities, drive_forces, masses, sim_time)
+
+    def run(self):
+        try:
+            chunks = []
+            for chunk in self.model.iter_riders(*self.args, chunk_size=self.chunk_size, **self.options):
+                if self.is_cancelled():
+                    break
+                chunks.append(chunk)
+                self.chunk_ready.emit(chunk)
+                self.progress.emit(int(100 * chunk.time[-1] / self.sim_time))
+            if self.is_cancelled():
+                self.cancelled.emit()
+                return
+            self.completed.emit(RidersResult.concatenate(chunks))
+        except Exception as e:
+            self.failed.emit(str(e))
+
+# --- END OF FILE worker.py ---